@@ -1,17 +1,17 @@
-import datetime
-import os
+from typing import Tuple
 
 import dash_core_components as dcc
 import dash_html_components as html
+import flask
 from dash.dependencies import Input, Output
 
+import dataserver
+import figure
 from app import app, application
 from apps import app_activity, app_comps, app_faq, app_specs, app_patrons, app_character
 
 DB_FILE_PATH = "data/summary.sqlite"
-data_last_updated = datetime.datetime.fromtimestamp(
-    int(os.path.getmtime(DB_FILE_PATH))
-).strftime("%Y-%m-%d")
+dataserver_ = dataserver.get_dataserver(DB_FILE_PATH)
 
 app.layout = html.Div(
     id="main-wrap",
@@ -33,10 +33,7 @@ app.layout = html.Div(
                 # html.A("FAQ", href="#faq"),
             ]
         ),
-        html.P(
-            "Data updated: %s" % data_last_updated,
-            style={"text-align": "right"},
-        ),
+        html.P(id="data-updated", style={"text-align": "right"}),
         html.Main(id="page-content"),
         html.Footer(
             children=[
@@ -49,23 +46,40 @@ app.layout = html.Div(
 )
 
 
-@app.callback(Output("page-content", "children"), Input("url", "pathname"))
-def display_page(pathname: str) -> html.Div:
-    """Returns main content of the page."""
+@app.callback(
+    [Output("page-content", "children"), Output("data-updated", "children")],
+    Input("url", "pathname"),
+)
+def display_page(pathname: str) -> Tuple[html.Div, str]:
+    """Returns main content of the page and the data timestamp."""
+    data_updated = "Data updated: %s" % dataserver_.data_last_updated()
     if pathname == "/comps":
-        return app_comps.layout
+        return app_comps.layout, data_updated
     elif pathname == "/activity":
-        return app_activity.layout
+        return app_activity.serve_layout(), data_updated
     elif pathname == "/faq":
-        return app_faq.layout
+        return app_faq.layout, data_updated
     elif pathname == "/":
-        return app_specs.layout
+        return app_specs.serve_layout(), data_updated
     elif pathname == "/patrons":
-        return app_patrons.layout
+        return app_patrons.layout, data_updated
     elif pathname == "/abc123x":
-        return app_character.layout
+        return app_character.layout, data_updated
     else:
-        return "This URL does not exist: ERROR 404"
+        return "This URL does not exist: ERROR 404", data_updated
+
+
+@application.route("/stats")
+def cache_stats() -> flask.Response:
+    """Returns cache hit/miss counts, compute times and search latency as JSON.
+
+    Counts are for the worker process that serves the request.
+    """
+    stats = dataserver_.cache_stats()
+    stats["figure_cache"] = app_specs.figure_cache.stats()
+    stats["bubble_layouts"] = figure.BubblePlot.layouts.stats()
+    stats["comp_search"] = app_comps.search_stats()
+    return flask.jsonify(stats)
 
 
 if __name__ == "__main__":
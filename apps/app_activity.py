@@ -3,14 +3,21 @@ import dash_core_components as dcc
 import dash_html_components as html
 import dataserver
 import figure
+import plotly.graph_objects as go
 from app import app
 
 DB_FILE_PATH = "data/summary.sqlite"
-dataserver_ = dataserver.DataServer(DB_FILE_PATH)
-data = dataserver_.get_activity_data()
-fig_ = figure.BasicBarChart(data)
-fig = fig_.draw_figure()
-fig = constructor.annotate_weekly_figure(fig)
+dataserver_ = dataserver.get_dataserver(DB_FILE_PATH)
+
+
+def create_activity_figure(snapshot: dataserver.DataSnapshot) -> go.Figure:
+    """Draws the weekly activity bar chart."""
+    data = dataserver_.get_activity_data(snapshot)
+    fig_ = figure.BasicBarChart(data)
+    fig = fig_.draw_figure()
+    fig = constructor.annotate_weekly_figure(fig)
+    return fig
+
 
 fig_config = dict(
     modeBarButtonsToRemove=[
@@ -26,14 +33,26 @@ fig_config = dict(
     displaylogo=False,
 )
 
-layout = html.Div(
-    [
-        html.H3("PLAYER ACTIVITY"),
-        html.P(
-            """This figure shows the number of M+ runs recorded each week
-            since the start of BFA S4."""
+
+def serve_layout() -> html.Div:
+    """Builds the page layout against the data currently served."""
+    snapshot = dataserver_.snapshot
+    fig = snapshot.derived(
+        "activity_figure",
+        lambda: dataserver_.shared(
+            "activity_figure",
+            lambda: figure.serialize(create_activity_figure(snapshot)),
+            snapshot,
         ),
-        dcc.Graph(figure=fig, config=fig_config),
-        html.Br(),
-    ]
-)
+    )
+    return html.Div(
+        [
+            html.H3("PLAYER ACTIVITY"),
+            html.P(
+                """This figure shows the number of M+ runs recorded each week
+                since the start of BFA S4."""
+            ),
+            dcc.Graph(figure=fig, config=fig_config),
+            html.Br(),
+        ]
+    )
@@ -1,46 +1,131 @@
 import math
+import threading
 import time
+from typing import Any, Dict, List, Tuple
 
 import blizzcolors
+import cache
+import compsearch
 import constructor
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_table
 import dataserver
+import numpy as np
 import pandas as pd
 from app import app
 from dash.dependencies import Input, Output, State
 
 DB_FILE_PATH = "data/summary.sqlite"
-dataserver_ = dataserver.DataServer(DB_FILE_PATH)
-composition = dataserver_.get_comp_data()
-print(composition)
-composition = blizzcolors.vectorize_comps(composition)
-# check that each comp has 5 members
-members = composition.composition.astype(str).map(len)
-composition = composition[members == 5]
-# check that each comp has a healer and a tank
-tank_cols = [
-    "death_knight_blood",
-    "demon_hunter_vengeance",
-    "druid_guardian",
-    "monk_brewmaster",
-    "paladin_protection",
-    "warrior_protection",
-]
-healer_cols = [
-    "druid_restoration",
-    "monk_mistweaver",
-    "paladin_holy",
-    "priest_discipline",
-    "priest_holy",
-    "shaman_restoration",
-]
-
-mask_tanks = composition[tank_cols].sum(axis=1) == 1
-mask_healers = composition[healer_cols].sum(axis=1) == 1
-mask = mask_tanks & mask_healers
-composition = composition[mask]
+dataserver_ = dataserver.get_dataserver(DB_FILE_PATH)
+SPECS = blizzcolors.Specs().specs
+
+
+def prepare_compositions(snapshot: dataserver.DataSnapshot) -> pd.DataFrame:
+    """Vectorizes comp tokens and keeps comps with 5 members, 1 tank, 1 healer."""
+    composition = blizzcolors.vectorize_comps(dataserver_.get_comp_data(snapshot))
+    spec_tokens = [spec["token"] for spec in SPECS]
+    five_members, one_tank, one_healer = blizzcolors.comp_masks(
+        composition[spec_tokens].to_numpy()
+    )
+    composition = composition[five_members & one_tank & one_healer]
+    return composition
+
+
+def get_compositions(snapshot: dataserver.DataSnapshot) -> pd.DataFrame:
+    """Returns valid vectorized comps of the snapshot, prepared once."""
+    return snapshot.derived(
+        "valid_compositions", lambda: prepare_compositions(snapshot)
+    )
+
+
+def get_composition_index(
+    snapshot: dataserver.DataSnapshot,
+) -> compsearch.CompositionIndex:
+    """Returns bitset index over get_compositions(), built once per snapshot."""
+    return snapshot.derived(
+        "composition_index",
+        lambda: compsearch.CompositionIndex.from_compositions(
+            get_compositions(snapshot)
+        ),
+    )
+
+
+# ordered results of comp searches, keyed by data version and canonical query
+query_cache = cache.LRUCache(maxsize=128)
+# time spent answering searches (hits and misses), served on /stats
+search_latency = {"searches": 0, "seconds": 0.0}
+search_latency_lock = threading.Lock()  # callbacks run in several threads
+
+
+def search(
+    snapshot: dataserver.DataSnapshot, fields: List, sortby: str
+) -> compsearch.SearchResult:
+    """Returns cached matches of slot selections in sortby order."""
+    fields, sortby = compsearch.canonical_query(fields, sortby)
+    return query_cache.get_or_compute(
+        (snapshot.version, fields, sortby),
+        lambda: get_composition_index(snapshot).search(fields, sortby),
+    )
+
+
+def record_search(start_time: float) -> None:
+    """Adds the time since start_time to the search latency."""
+    seconds = time.perf_counter() - start_time
+    with search_latency_lock:
+        search_latency["searches"] += 1
+        search_latency["seconds"] += seconds
+
+
+def search_stats() -> Dict[str, float]:
+    """Returns query cache stats (hit rate, miss cost) and search latency."""
+    stats = query_cache.stats()
+    with search_latency_lock:
+        searches, seconds = search_latency["searches"], search_latency["seconds"]
+    stats["searches"] = searches
+    stats["mean_search_seconds"] = seconds / searches if searches else 0.0
+    return stats
+
+
+def prepare_rows(snapshot: dataserver.DataSnapshot) -> Dict[str, np.ndarray]:
+    """Extracts what the result table shows of each valid comp, vectorized.
+
+    Returns
+    -------
+    rows : dict
+        'tank' and 'healer' spec index (in SPECS) of each comp, 'dps' spec
+        counts (n_comps, n_dps specs) with their 'dps_specs' indexes, and
+        the 'run_count', 'level_mean' (rounded) and 'level_max' stats
+    """
+    composition = get_compositions(snapshot)
+    roles = np.array([spec["role"] for spec in SPECS])
+    counts = composition[[spec["token"] for spec in SPECS]].to_numpy()
+    tanks = np.flatnonzero(roles == "tank")
+    healers = np.flatnonzero(roles == "healer")
+    dps_specs = np.flatnonzero(np.isin(roles, ["mdps", "rdps"]))
+    rows = dict(
+        tank=tanks[counts[:, tanks].argmax(axis=1)],
+        healer=healers[counts[:, healers].argmax(axis=1)],
+        dps=counts[:, dps_specs],
+        dps_specs=dps_specs,
+        run_count=composition.run_count.to_numpy(),
+        level_mean=composition.level_mean.round(decimals=1).to_numpy(),
+        level_max=composition.level_max.to_numpy(),
+    )
+    return rows
+
+
+def get_rows(snapshot: dataserver.DataSnapshot) -> Dict[str, np.ndarray]:
+    """Returns prepare_rows() of the snapshot, prepared once."""
+    return snapshot.derived("composition_rows", lambda: prepare_rows(snapshot))
+
+
+def get_row_cache(snapshot: dataserver.DataSnapshot) -> cache.LRUCache:
+    """Returns the cache of table cells of each comp, one per snapshot."""
+    return snapshot.derived(
+        "composition_row_cells", lambda: cache.LRUCache(maxsize=4096)
+    )
+
 
 layout = html.Div(
     [
@@ -124,183 +209,118 @@ def find_compositions(
     third_dps_slot,
 ):
     """Finds compositions that include selected specs."""
+    start_time = time.perf_counter()
+    # one data version for the whole callback, even if a reload swaps it
+    snapshot = dataserver_.snapshot
     if page_number < 1:
         page_number = 1
     if main_click_ts and page_click_ts:
         if int(main_click_ts) > int(page_click_ts):
             page_number = 1
     fields = [tank_slot, healer_slot, first_dps_slot, second_dps_slot, third_dps_slot]
-    fields = [field for field in fields if field]
-    mask = None
-    if fields == []:
-        mask = [True] * len(composition)
     # Each field can have multiple entries. These need to be treated as
     # OR selectors. For example, if field = [a, b, c], find all comps that
-    # include a or b or c
-    for field in fields:  # too many loops T_T
-        field_mask = None
-        if len(field) > 1:
-            for spec in field:
-                if type(field_mask) == pd.Series:
-                    field_mask = (field_mask) | (composition[spec] > 0)
-                else:
-                    field_mask = composition[spec] > 0
-        else:
-            # the .count is there in case the user wants to find comp
-            # with two or three of the same spec
-            field_mask = composition[field[0]] >= fields.count(field)
-        if type(mask) == pd.Series:
-            mask = mask & field_mask
-        else:
-            mask = field_mask
-    cmpz = composition[mask].copy(deep=True)
-    if len(cmpz) == 0:
+    # include a or b or c; see CompositionIndex.match
+    result = search(snapshot, fields, sortby)
+    total = result.count
+    if total == 0:
         msg = """There are no compositions like that in the database.
             If you get this message, let met know in Discord."""
+        record_search(start_time)
         return msg, 0, 0
-    # sort the result inplace
-    sortby_col = {
-        "max+total+avg": ["level_max", "run_count", "level_mean"],
-        "max+avg+total": ["level_max", "level_mean", "run_count"],
-        "total": ["run_count", "level_mean"],
-        "avg": ["level_mean", "run_count"],
-    }
-    cmpz.sort_values(by=sortby_col[sortby], axis=0, ascending=False, inplace=True)
-    total_pages = math.ceil(len(cmpz) / 50.0)
+    # pages of cached results are slices of the sorted row ids
+    total_pages = math.ceil(total / 50.0)
 
     if page_number > total_pages:
         page_number = total_pages - 1
-        cmpz = cmpz[page_number * 50 :]
+        start, stop = page_number * 50, total
     else:
         page_number = page_number - 1
-        cmpz = cmpz[50 * page_number : (50 * page_number) + 50]
-    return format_output(cmpz), page_number + 1, "of %d" % total_pages
+        start, stop = 50 * page_number, (50 * page_number) + 50
+    table = format_output(snapshot, result.page(start, stop))
+    record_search(start_time)
+    return table, page_number + 1, "of %d" % total_pages
+
 
+def spec_cell(spec: dict, count: int, chars: int) -> html.Td:
+    """Creates a table cell of count members of spec, in the class color."""
+    style = {
+        "background-color": "rgb(%d,%d,%d)" % spec["color"],
+        "border": "1px solid black",
+    }
+    text = spec["abbr"][:chars] if count == 1 else "x%d" % count
+    return html.Td(text, title=spec["token"].upper().replace("_", " "), style=style)
+
+
+def row_cells(
+    rows: Dict[str, np.ndarray], row_cache: cache.LRUCache, row: int, chars: int
+) -> Tuple[List[html.Td], Dict[int, html.Td]]:
+    """Returns the cells of a comp: stats, tank, healer, and DPS by column.
 
-# def find_tank(result: pd.DataFrame):
+    Cells are built once per comp and abbreviation length, then kept in
+    row_cache; rows and row_cache must come from the same snapshot (see
+    format_output). Pages only assemble the cells.
+    """
 
+    def build():
+        cells = [
+            html.Td(int(rows["run_count"][row])),
+            html.Td("%1.1f" % rows["level_mean"][row]),
+            html.Td(int(rows["level_max"][row])),
+            spec_cell(SPECS[rows["tank"][row]], 1, chars),
+            spec_cell(SPECS[rows["healer"][row]], 1, chars),
+        ]
+        dps_cells = {
+            column: spec_cell(SPECS[rows["dps_specs"][column]], count, chars)
+            for column, count in enumerate(rows["dps"][row])
+            if count
+        }
+        return cells, dps_cells
 
-def format_output(result0: pd.DataFrame) -> html.Table:
-    """Formats results of the comp search into a data table."""
+    return row_cache.get_or_compute((row, chars), build)
+
+
+def format_output(snapshot: dataserver.DataSnapshot, page: np.ndarray) -> html.Table:
+    """Formats a page of comp search results (row ids) into a data table."""
     # Formatting the results is a massive PITA.
     # There are 40+ columns, and condensing them into something that
     # both fits on the screen and is interpretable is rough.
-    # So here is what we do:
-    # Find the tanks and condense them into a single column.
-    tank_cols = [
-        "death_knight_blood",
-        "demon_hunter_vengeance",
-        "druid_guardian",
-        "monk_brewmaster",
-        "paladin_protection",
-        "warrior_protection",
-    ]
-    tanks = result0[tank_cols].apply(lambda row: tank_cols[list(row).index(1)], axis=1)
-    # Find the healers and condense them into a single column.
-    healer_cols = [
-        "druid_restoration",
-        "monk_mistweaver",
-        "paladin_holy",
-        "priest_discipline",
-        "priest_holy",
-        "shaman_restoration",
-    ]
-    healers = result0[healer_cols].apply(
-        lambda row: healer_cols[list(row).index(1)], axis=1
-    )
-    # drop both healers and tanks from the main table
-    result0.drop(
-        inplace=True,
-        labels=tank_cols + healer_cols,
-        axis=1,
-    )
-    # and append the condensed columns
-    result0["tank"] = tanks
-    result0["healer"] = healers
-
-    # remove stats for now
-    stats = result0[["run_count", "level_mean", "level_max"]].copy(deep=True)
-    stats = stats.round(decimals=1)
-    stats = list(stats.values)
-    result0.drop(
-        inplace=True,
-        labels=["composition", "run_count", "level_mean", "level_std", "level_max"],
-        axis=1,
-    )
-    t0 = time.time()
-    # Drop DPS columns that are all 0.
-    mask = list(result0.sum(axis=0) != 0)
-    result0 = result0.loc[:, mask]
-
-    # rearrange columns
-    new_order = ["tank", "healer"]
-    dps_cols = [dps for dps in result0.columns if dps not in new_order]
-    dps_order = result0[dps_cols].sum(axis=0)
-    dps_order = dps_order.sort_values(ascending=False, inplace=False).index.values
-    new_order.extend(dps_order)
-    result0 = result0[new_order]
-
-    rows = result0.apply(lambda row: list(row), axis=1)
-    colors = dict(
-        [[spec["token"], spec["color"]] for spec in blizzcolors.Specs().specs]
-    )
+    # So here is what we do: tanks and healers get a single column each,
+    # and DPS specs get a column only if they are in some comp of the page,
+    # the most common first.
+    rows = get_rows(snapshot)
+    row_cache = get_row_cache(snapshot)
+    dps = rows["dps"][page]
+    dps_totals = dps.sum(axis=0)
+    dps_columns = np.flatnonzero(dps_totals)
+    dps_columns = dps_columns[np.argsort(-dps_totals[dps_columns], kind="mergesort")]
+    num_columns = 2 + len(dps_columns)
     chars = 10
-    if len(result0.columns) >= 20:
+    if num_columns >= 20:
         chars = 2
-    elif len(result0.columns) < 20 and len(result0.columns) >= 17:
+    elif num_columns < 20 and num_columns >= 17:
         chars = 3
-    elif len(result0.columns) < 17 and len(result0.columns) >= 10:
+    elif num_columns < 17 and num_columns >= 10:
         chars = 4
-    abbr = dict(
-        [[spec["token"], spec["abbr"][:chars]] for spec in blizzcolors.Specs().specs]
+    dps_specs = rows["dps_specs"]
+    header = html.Tr(
+        [
+            html.Th(column[:chars])
+            for column in ["N", "AVG", "MAX", "TANK", "HLR"]
+            + [SPECS[dps_specs[column]]["abbr"][:chars] for column in dps_columns]
+        ],
+        style={"font-size": "15px"},
     )
-    table = html.Table(children=[])
-    for row_index, row in enumerate(rows):
-        row_ = html.Tr(
-            children=[
-                html.Td(stats[row_index][0]),
-                html.Td("%1.1f" % stats[row_index][1]),
-                html.Td(stats[row_index][2]),
-            ]
-        )
+    table = html.Table(children=[header])
+    for row_index, row in enumerate(page):
+        cells, dps_cells = row_cells(rows, row_cache, int(row), chars)
         bg_color = "lightgray" if row_index % 2 == 0 else "white"
-        for index, cell in enumerate(row):
-            style = {}
-            if result0.columns[index] in ["tank", "healer"]:
-                color = colors[cell]
-                style = {
-                    "background-color": "rgb(%d,%d,%d)" % color,
-                    "border": "1px solid black",
-                }
-                title = cell.upper().replace("_", " ")
-                cell = abbr[cell]
-            elif cell == 0:
-                style = {"background-color": bg_color, "color": bg_color}
-                title = ""
-            else:
-                style = {
-                    "background-color": "rgb(%d,%d,%d)"
-                    % colors[result0.columns[index]],
-                    "border": "1px solid black",
-                }
-                title = result0.columns[index].upper().replace("_", " ")
-                if cell == 1:
-                    cell = abbr[result0.columns[index]]
-                else:
-                    cell = "x%d" % cell
-            row_.children.append(html.Td(cell, title=title, style=style))
-        row_.style = {"background-color": bg_color}
-        table.children.append(row_)
-    table.children.insert(
-        0,
-        html.Tr(
-            [
-                html.Th(column[:chars])
-                for column in ["N", "AVG", "MAX", "TANK", "HLR"]
-                + [abbr[tkn] for tkn in result0.columns[2:]]
-            ],
-            style={"font-size": "15px"},
-        ),
-    )
-    print("Table formatting ", time.time() - t0)
+        # DPS specs of other comps in the page: blank, in the row color
+        blank = html.Td(
+            0, title="", style={"background-color": bg_color, "color": bg_color}
+        )
+        children = cells + [dps_cells.get(column, blank) for column in dps_columns]
+        table.children.append(
+            html.Tr(children=children, style={"background-color": bg_color})
+        )
     return table
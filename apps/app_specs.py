@@ -1,5 +1,6 @@
-from typing import List, Tuple
+from typing import Any, Callable, Dict, Hashable, List, Tuple
 
+import cache
 import constructor
 import dash_core_components as dcc
 import dash_html_components as html
@@ -7,10 +8,10 @@ import dataserver
 import figure
 import plotly.graph_objects as go
 from app import app
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output, State
 
 DB_FILE_PATH = "data/summary.sqlite"
-dataserver_ = dataserver.DataServer(DB_FILE_PATH)
+dataserver_ = dataserver.get_dataserver(DB_FILE_PATH)
 
 CURRENT_SEASON = "SL1"
 PATCH_NAMES = {
@@ -151,11 +152,13 @@ figure_header_elements = {
 # To solve this, let's precompute  panel 1 figures
 # so they come preloaded on start up
 # ridge plot and bubble plot (panel 1 and 2)
-def create_figure1(season: str) -> Tuple[go.Figure]:
+def create_figure1(snapshot: dataserver.DataSnapshot, season: str) -> Tuple[go.Figure]:
     """Create the 3 panels of figure 1 based on season.
 
     Parameters
     ----------
+    snapshot : dataserver.DataSnapshot
+        data version to plot
     season : str
         season for which to plot the figure
 
@@ -167,136 +170,225 @@ def create_figure1(season: str) -> Tuple[go.Figure]:
     """
     patch_name = PATCH_NAMES[season]
     # ridge plot and bubble plot (panel 1 and 2)
-    runs_per_spec_and_level = dataserver_.get_data_for_ridgeplot(season)
+    runs_per_spec_and_level = dataserver_.get_data_for_ridgeplot(season, snapshot)
     ridgeplot = figure.RidgePlot(runs_per_spec_and_level, patch_name)
-    bubble = figure.BubblePlot(runs_per_spec_and_level, patch_name)
+    bubble = figure.BubblePlot(
+        runs_per_spec_and_level,
+        patch_name,
+        cache_key=(dataserver_.db_file_path, season, snapshot.version),
+    )
     # histogram (panel 3)
-    runs_per_level = dataserver_.get_data_for_run_histogram(season)
+    runs_per_level = dataserver_.get_data_for_run_histogram(season, snapshot)
     hist = figure.BasicHistogram(runs_per_level, patch_name)
     return ridgeplot.figure, bubble.make_figure2(), hist.make_figure()
 
 
-default_ridgeplot, default_bubble, default_hist = create_figure1(CURRENT_SEASON)
+def precompute_figure1(snapshot: dataserver.DataSnapshot) -> Dict[str, Tuple[dict]]:
+    """Renders figure 1 panels for every season in the snapshot.
 
+    Returns
+    -------
+    figures : dict(str, Tuple(dict))
+        season -> serialized (JSON-ready) ridgeplot, bubble plot, and histogram
+    """
+    seasons = [
+        season for season in dataserver_.get_seasons(snapshot) if season in PATCH_NAMES
+    ]
+    figures = {}
+    for season in seasons:
+        # other workers may have rendered this season already
+        panels = dataserver_.shared(
+            "figure1:%s" % season,
+            lambda: [figure.serialize(fig) for fig in create_figure1(snapshot, season)],
+            snapshot,
+        )
+        figures[season] = tuple(panels)
+    return figures
 
-layout = html.Div(
-    [
-        html.Div(
-            id="master-switch-wrapper",
-            children=[
-                html.H4("SELECT SEASON"),
-                constructor.season_dropdown(id_="master-season-switch", ishidden=False),
-            ],
-        ),
-        html.Div(
-            className="figure-header",
-            children=constructor.figure_header_ensemble(
-                figure_header_elements["figure1"]
+
+def get_figure1(snapshot: dataserver.DataSnapshot, season: str) -> Tuple[dict]:
+    """Returns serialized figure 1 panels, rendered once per snapshot."""
+    return snapshot.derived("figure1", lambda: precompute_figure1(snapshot))[season]
+
+
+# render all seasons on start up, so the first page load is not the slow one
+get_figure1(dataserver_.snapshot, CURRENT_SEASON)
+
+# client-side data of figures 2-4 is built once per season and data version
+# and kept here; misses fall through to the disk cache shared by the workers,
+# if enabled
+figure_cache = cache.LRUCache(maxsize=64)
+
+
+def get_cached(
+    snapshot: dataserver.DataSnapshot,
+    name: str,
+    inputs: Tuple[Hashable],
+    build: Callable,
+) -> Any:
+    """Returns build() for normalized inputs and the snapshot's data version.
+
+    Parameters
+    ----------
+    snapshot : dataserver.DataSnapshot
+        data version build() reads from
+    name : str
+        name of the figure (keeps keys of different figures apart)
+    inputs : Tuple[Hashable]
+        normalized callback inputs the figure depends on
+    build : Callable
+        returns the serialized (JSON-ready) figure or figure data on a miss
+
+    Returns
+    -------
+    value : Any
+        serialized figure or figure data
+    """
+    key = (name, snapshot.version) + tuple(inputs)
+    return figure_cache.get_or_compute(
+        key,
+        lambda: dataserver_.shared("%s:%r" % (name, tuple(inputs)), build, snapshot),
+    )
+
+
+def serve_layout() -> html.Div:
+    """Builds the page layout against the data currently served."""
+    snapshot = dataserver_.snapshot
+    default_ridgeplot, default_bubble, default_hist = get_figure1(
+        snapshot, CURRENT_SEASON
+    )
+    max_key_level = dataserver_.get_max_key_for_season(CURRENT_SEASON, snapshot)
+    return html.Div(
+        [
+            html.Div(
+                id="master-switch-wrapper",
+                children=[
+                    html.H4("SELECT SEASON"),
+                    constructor.season_dropdown(
+                        id_="master-season-switch", ishidden=False
+                    ),
+                ],
             ),
-        ),
-        dcc.Tabs(
-            children=[
-                dcc.Tab(
-                    label="RUNS BY SPEC & KEY LEVEL",
-                    children=[
-                        constructor.season_dropdown(
-                            id_="fig1-ridgeplot-season-switch",
-                            ishidden=True,
-                        ),
-                        dcc.Graph(
-                            className="figure",
-                            id="fig1-ridgeplot",
-                            figure=default_ridgeplot,
-                            config=fig_config,
-                            style={"margin-top": "20px"},
-                        ),
-                    ],
+            html.Div(
+                className="figure-header",
+                children=constructor.figure_header_ensemble(
+                    figure_header_elements["figure1"]
                 ),
-                dcc.Tab(
-                    label="RUNS BY SPEC",
-                    children=[
-                        constructor.season_dropdown(
-                            id_="fig1-bubble-season-switch", ishidden=True
-                        ),
-                        dcc.Graph(
-                            className="figure",
-                            id="fig1-bubble-chart",
-                            figure=default_bubble,
-                            config=fig_config,
-                        ),
-                    ],
+            ),
+            dcc.Tabs(
+                children=[
+                    dcc.Tab(
+                        label="RUNS BY SPEC & KEY LEVEL",
+                        children=[
+                            constructor.season_dropdown(
+                                id_="fig1-ridgeplot-season-switch",
+                                ishidden=True,
+                            ),
+                            dcc.Graph(
+                                className="figure",
+                                id="fig1-ridgeplot",
+                                figure=default_ridgeplot,
+                                config=fig_config,
+                                style={"margin-top": "20px"},
+                            ),
+                        ],
+                    ),
+                    dcc.Tab(
+                        label="RUNS BY SPEC",
+                        children=[
+                            constructor.season_dropdown(
+                                id_="fig1-bubble-season-switch", ishidden=True
+                            ),
+                            dcc.Graph(
+                                className="figure",
+                                id="fig1-bubble-chart",
+                                figure=default_bubble,
+                                config=fig_config,
+                            ),
+                        ],
+                    ),
+                    dcc.Tab(
+                        label="RUNS BY KEY LEVEL",
+                        children=[
+                            constructor.season_dropdown(
+                                id_="fig1-key-hist-season-switch", ishidden=True
+                            ),
+                            dcc.Graph(
+                                className="figure",
+                                id="fig1-key-hist",
+                                figure=default_hist,
+                                config=fig_config,
+                            ),
+                        ],
+                    ),
+                ]
+            ),
+            html.Br(),
+            html.Div(
+                className="figure-header",
+                children=constructor.figure_header_ensemble(
+                    figure_header_elements["figure2"]
                 ),
-                dcc.Tab(
-                    label="RUNS BY KEY LEVEL",
-                    children=[
-                        constructor.season_dropdown(
-                            id_="fig1-key-hist-season-switch", ishidden=True
-                        ),
-                        dcc.Graph(
-                            className="figure",
-                            id="fig1-key-hist",
-                            figure=default_hist,
-                            config=fig_config,
-                        ),
-                    ],
+            ),
+            constructor.season_dropdown(id_="fig2-season-switch", ishidden=True),
+            dcc.Store(id="figure2-store"),
+            constructor.spec_dropdown(id_="figure2-dropdown"),
+            dcc.Graph(
+                id="keylevel-stacked-fig",
+                config=fig_config,
+            ),
+            html.Hr(),
+            html.Div(
+                className="figure-header",
+                children=constructor.figure_header_ensemble(
+                    figure_header_elements["figure3"]
                 ),
-            ]
-        ),
-        html.Br(),
-        html.Div(
-            className="figure-header",
-            children=constructor.figure_header_ensemble(
-                figure_header_elements["figure2"]
             ),
-        ),
-        constructor.season_dropdown(id_="fig2-season-switch", ishidden=True),
-        constructor.spec_dropdown(id_="figure2-dropdown"),
-        dcc.Graph(
-            id="keylevel-stacked-fig",
-            config=fig_config,
-        ),
-        html.Hr(),
-        html.Div(
-            className="figure-header",
-            children=constructor.figure_header_ensemble(
-                figure_header_elements["figure3"]
+            constructor.season_dropdown(id_="fig3-season-switch", ishidden=True),
+            dcc.Store(
+                id="figure3-store",
+                data=get_cached(
+                    snapshot,
+                    "figure3-store",
+                    (),
+                    lambda: create_figure3_store(snapshot),
+                ),
             ),
-        ),
-        constructor.season_dropdown(id_="fig3-season-switch", ishidden=True),
-        constructor.spec_dropdown(id_="figure3-dropdown"),
-        dcc.Graph(id="week-stacked-fig", config=fig_config),
-        html.Hr(),
-        constructor.season_dropdown(id_="fig4-season-switch", ishidden=True),
-        html.Div(
-            className="figure-header",
-            children=constructor.figure_header_ensemble(
-                figure_header_elements["figure4"]
+            constructor.spec_dropdown(id_="figure3-dropdown"),
+            dcc.Graph(id="week-stacked-fig", config=fig_config),
+            html.Hr(),
+            constructor.season_dropdown(id_="fig4-season-switch", ishidden=True),
+            html.Div(
+                className="figure-header",
+                children=constructor.figure_header_ensemble(
+                    figure_header_elements["figure4"]
+                ),
             ),
-        ),
-        html.P("Color specs on bar chart:"),
-        constructor.spec_dropdown(id_="figure4-dropdown", include_all=True),
-        html.P("Population-level keys"),
-        html.Div(
-            id="population-slider-wrapper",
-            children=constructor.key_level_slider(
-                id_="population-slider",
-                range_max=dataserver_.get_max_key_for_season(season=CURRENT_SEASON),
-                selected_range=[2, 15],
+            html.P("Color specs on bar chart:"),
+            constructor.spec_dropdown(id_="figure4-dropdown", include_all=True),
+            html.P("Population-level keys"),
+            html.Div(
+                id="population-slider-wrapper",
+                children=constructor.key_level_slider(
+                    id_="population-slider",
+                    range_max=max_key_level,
+                    selected_range=[2, 15],
+                ),
             ),
-        ),
-        html.P("Meta-level keys"),
-        html.Div(
-            id="meta-slider-wrapper",
-            children=constructor.key_level_slider(
-                id_="meta-slider",
-                range_max=dataserver_.get_max_key_for_season(season=CURRENT_SEASON),
-                selected_range=[16, 99],  # select it to the end
+            html.P("Meta-level keys"),
+            html.Div(
+                id="meta-slider-wrapper",
+                children=constructor.key_level_slider(
+                    id_="meta-slider",
+                    range_max=max_key_level,
+                    selected_range=[16, 99],  # select it to the end
+                ),
             ),
-        ),
-        dcc.Graph(id="meta-index-fig", config=fig_config),
-        html.Br(),
-    ]
-)
+            dcc.Store(id="figure4-store"),
+            dcc.Graph(id="meta-index-fig", config=fig_config),
+            html.Br(),
+        ]
+    )
 
 
 @app.callback(
@@ -308,7 +400,7 @@ layout = html.Div(
     Input(component_id="fig1-ridgeplot-season-switch", component_property="value"),
     prevent_initial_call=True,
 )
-def update_figure1(season: str) -> Tuple[go.Figure]:
+def update_figure1(season: str) -> Tuple[dict]:
     """Updates the 3 panels of figure 1 based on season.
 
     Parameters
@@ -318,117 +410,136 @@ def update_figure1(season: str) -> Tuple[go.Figure]:
 
     Returns
     -------
-    Tuple(go.Figure)
-        Tuple containing the ridgeplot, bubble plot, and
+    Tuple(dict)
+        Tuple containing the serialized ridgeplot, bubble plot, and
         the histogram
     """
-    return create_figure1(season)
+    return get_figure1(dataserver_.snapshot, season)
 
 
 @app.callback(
-    Output(component_id="keylevel-stacked-fig", component_property="figure"),
-    [
-        Input(component_id="figure2-dropdown", component_property="value"),
-        Input(component_id="fig2-season-switch", component_property="value"),
-    ],
+    Output(component_id="figure2-store", component_property="data"),
+    Input(component_id="fig2-season-switch", component_property="value"),
 )
-def update_figure2(role, season) -> go.Figure:
-    """Updates figure 2 (spec % vs key level).
+def update_figure2_store(season: str) -> dict:
+    """Sends figure 2 (spec % vs key level) data of the season to the browser.
+
+    Role changes are drawn client-side from this store, see
+    assets/clientside.js.
 
     Parameters
     ----------
-    role : str
-        specs to include in the figure; one of {'tank', 'healer', 'mdps', 'rdps'}
     season : str
         season for which to plot the figure
 
     Returns
     -------
-    stack_figure : go.Figure
-        top 500 weekly bar chart
+    store : dict
+        figure 2 data for all roles, see figure.stacked_chart_store
     """
+    snapshot = dataserver_.snapshot
+    return get_cached(
+        snapshot,
+        "figure2-store",
+        (season,),
+        lambda: create_figure2_store(snapshot, season),
+    )
+
+
+def create_figure2_store(snapshot: dataserver.DataSnapshot, season: str) -> dict:
+    """Packs figure 2 (spec % vs key level) for client-side drawing."""
     patch_name = PATCH_NAMES[season]
-    runs_per_spec_and_level = dataserver_.get_data_for_ridgeplot(season)
-    stac = figure.StackedBarChart(runs_per_spec_and_level, "key", role, patch_name)
-    stack_figure = stac.assemble_figure()
-    return stack_figure
+    runs_per_spec_and_level = dataserver_.get_data_for_ridgeplot(season, snapshot)
+    return figure.stacked_chart_store(runs_per_spec_and_level, "key", patch_name)
 
 
-@app.callback(
+def create_figure3_store(snapshot: dataserver.DataSnapshot) -> dict:
+    """Packs figure 3 (the top 500 weekly bar chart) for client-side drawing.
+
+    The chart spans all seasons, so the store does not depend on season.
+    """
+    runs_per_week_and_spec = dataserver_.get_data_for_weekly_chart(snapshot=snapshot)
+    patch_name = "since BFA S4"
+    return figure.stacked_chart_store(
+        runs_per_week_and_spec,
+        "week",
+        patch_name,
+        decorate=constructor.annotate_weekly_figure,
+    )
+
+
+# figures 2 and 3 switch roles in the browser, without a server round trip
+app.clientside_callback(
+    ClientsideFunction(namespace="metawatch", function_name="stackedChart"),
+    Output(component_id="keylevel-stacked-fig", component_property="figure"),
+    [
+        Input(component_id="figure2-dropdown", component_property="value"),
+        Input(component_id="figure2-store", component_property="data"),
+    ],
+)
+app.clientside_callback(
+    ClientsideFunction(namespace="metawatch", function_name="stackedChart"),
     Output(component_id="week-stacked-fig", component_property="figure"),
     [
         Input(component_id="figure3-dropdown", component_property="value"),
-        Input(component_id="fig3-season-switch", component_property="value"),
+        Input(component_id="figure3-store", component_property="data"),
     ],
 )
-def update_figure3(role: str, season: str) -> go.Figure:
-    """Updates figure 3 (the top 500 weekly bar chart).
+
+
+@app.callback(
+    Output(component_id="figure4-store", component_property="data"),
+    Input(component_id="fig4-season-switch", component_property="value"),
+)
+def update_figure4_store(season: str) -> dict:
+    """Sends figure 4 (the tier list) data of the season to the browser.
+
+    Slider and role changes are drawn client-side from this store, see
+    assets/clientside.js.
 
     Parameters
     ----------
-    role : str
-        specs to include in the figure; one of {'tank', 'healer', 'mdps', 'rdps'}
     season : str
         season for which to plot the figure
 
     Returns
     -------
-    stack_figure : go.Fig
-        top 500 weekly bar chart
+    store : dict
+        cumulative runs per spec and key level with the figure template,
+        see figure.MetaIndexBarChart.to_store
     """
-    runs_per_week_and_spec = dataserver_.get_data_for_weekly_chart()
-    patch_name = "since BFA S4"
-    stack_figure = figure.StackedBarChart(
-        runs_per_week_and_spec, "week", role, patch_name
+    snapshot = dataserver_.snapshot
+    return get_cached(
+        snapshot,
+        "figure4-store",
+        (season,),
+        lambda: create_figure4_store(snapshot, season),
     )
-    stack_figure = stack_figure.assemble_figure()
-    stack_figure = constructor.annotate_weekly_figure(stack_figure)
-    return stack_figure
 
 
-@app.callback(
+def create_figure4_store(snapshot: dataserver.DataSnapshot, season: str) -> dict:
+    """Packs figure 4 (the tier list) for client-side drawing."""
+    fig = figure.MetaIndexBarChart(
+        data=dataserver_.get_data_for_meta_index(season, snapshot),
+        spec_role="all",
+    )
+    patch_name = PATCH_NAMES[season]
+    return fig.to_store(title="<b>SPEC TIER LIST (%s)</b>" % patch_name)
+
+
+# the tier list follows sliders and role in the browser, without a round trip;
+# a role change only recolors the bars of the current figure
+app.clientside_callback(
+    ClientsideFunction(namespace="metawatch", function_name="tierList"),
     Output(component_id="meta-index-fig", component_property="figure"),
     [
         Input(component_id="population-slider", component_property="value"),
         Input(component_id="meta-slider", component_property="value"),
         Input(component_id="figure4-dropdown", component_property="value"),
-        Input(component_id="fig4-season-switch", component_property="value"),
+        Input(component_id="figure4-store", component_property="data"),
     ],
+    State(component_id="meta-index-fig", component_property="figure"),
 )
-def update_figure4(
-    population_slider: List[int], meta_slider: List[int], spec_role: str, season: str
-) -> go.Figure:
-    """Updates figure 4 (the tier list).
-
-    Parameters
-    ----------
-    population_slider : List[int]
-        value of the population slider
-    meta_slider : List[int]
-        value of the meta slider
-    season : str
-        season for which to plot the figure
-    spec_role : str
-        specs to include in the figure; one of {'tank', 'healer', 'mdps', 'rdps'}
-
-    Returns
-    -------
-    spec_meta_fig : go.Fig
-        spec meta index / spec tier bar chart
-    """
-    population_min, population_max = population_slider
-    meta_min, meta_max = meta_slider
-    data = dataserver_.raw_data["specs"]
-    fig = figure.MetaIndexBarChart(
-        data=data[data["season"] == season],
-        spec_role=spec_role,
-    )
-    spec_meta_fig = fig.create_figure(
-        bounds=[population_min, population_max, meta_min, meta_max]
-    )
-    patch_name = PATCH_NAMES[season]
-    spec_meta_fig.update_layout(title_text="<b>SPEC TIER LIST (%s)</b>" % patch_name)
-    return spec_meta_fig
 
 
 @app.callback(
@@ -454,14 +565,15 @@ def update_slider_max_range(season: str) -> Tuple[dcc.RangeSlider]:
     meta_slider : dcc.RangeSlider
         updated meta slider
     """
+    max_key_level = dataserver_.get_max_key_for_season(season)
     population_slider = constructor.key_level_slider(
         id_="population-slider",
-        range_max=dataserver_.get_max_key_for_season(season=season),
+        range_max=max_key_level,
         selected_range=[2, 15],  # select it to the end
     )
     meta_slider = constructor.key_level_slider(
         id_="meta-slider",
-        range_max=dataserver_.get_max_key_for_season(season=season),
+        range_max=max_key_level,
         selected_range=[16, 99],  # select it to the end
     )
     return population_slider, meta_slider
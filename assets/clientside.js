@@ -0,0 +1,213 @@
+/*
+ * Clientside callbacks of the specs page.
+ *
+ * The server ships the data of a figure once per season (dcc.Store) and
+ * these functions redraw the figure for the selected role in the browser.
+ */
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    metawatch: {
+        /*
+         * Draws a stacked share chart (figures 2 and 3) for one spec role.
+         *
+         * store is made by figure.stacked_chart_store: keeps the rows of the
+         * role and renormalizes them to 100% in each x bin. Key level
+         * buckets (width, customdata) come with the trace template.
+         */
+        stackedChart: function (role, store) {
+            if (!store) {
+                return window.dash_clientside.no_update;
+            }
+            var decode = window.dash_clientside.metawatch.decode;
+            var x = decode(store.x);
+            var counts = decode(store.counts);
+            var rows = [];
+            var specs = [];
+            store.specs.forEach(function (spec, index) {
+                if (spec.role === role) {
+                    rows.push(counts[index]);
+                    specs.push(spec);
+                }
+            });
+            var totals = x.map(function (_, bin) {
+                return rows.reduce(function (total, row) {
+                    return total + row[bin];
+                }, 0);
+            });
+            var traces = specs.map(function (spec, index) {
+                var trace = Object.assign({}, store.trace, {
+                    x: x,
+                    y: rows[index].map(function (runs, bin) {
+                        return totals[bin] ? (100 * runs) / totals[bin] : null;
+                    }),
+                    name: spec.name,
+                    meta: spec.name,
+                });
+                trace.marker = Object.assign({}, store.trace.marker, {
+                    color: spec.color,
+                });
+                return trace;
+            });
+            var layout = Object.assign({}, store.layout, {
+                title: Object.assign({}, store.layout.title, {
+                    text: store.titles[role],
+                }),
+            });
+            return {data: traces, layout: layout};
+        },
+
+        /*
+         * Draws the tier list (figure 4) for slider bounds and spec role.
+         *
+         * store is made by figure.MetaIndexBarChart.to_store; mirrors
+         * MetaIndexBarChart.create_figure. When only the role changed, the
+         * bars of the current figure are just recolored.
+         */
+        tierList: function (populationBounds, metaBounds, role, store, current) {
+            if (!store || !populationBounds || !metaBounds) {
+                return window.dash_clientside.no_update;
+            }
+            var metawatch = window.dash_clientside.metawatch;
+            var context = window.dash_clientside.callback_context;
+            var roleOnly =
+                context &&
+                context.triggered.length === 1 &&
+                context.triggered[0].prop_id === "figure4-dropdown.value";
+            var bars = current && current.data && current.data[current.data.length - 1];
+            if (roleOnly && bars && bars.customdata) {
+                return metawatch.recolorTierList(current, store, role);
+            }
+            var population = metawatch.specShareInBin(
+                store, populationBounds[0], populationBounds[1]
+            );
+            var meta = metawatch.specShareInBin(store, metaBounds[0], metaBounds[1]);
+            // meta index: spec share at meta level / spec share at population level,
+            // 0 without population-level runs (see MetaIndexBarChart._calculate_index)
+            var order = store.specs.map(function (_, row) {
+                return row;
+            });
+            var index = order.map(function (row) {
+                return population[row] > 0 ? meta[row] / population[row] : 0;
+            });
+            // Array.prototype.sort is stable, like the server's mergesort
+            order.sort(function (a, b) {
+                return index[a] - index[b];
+            });
+            var names = order.map(function (row) {
+                return store.specs[row].name;
+            });
+            var positions = order.map(function (_, position) {
+                return position;
+            });
+            var figure = store.figure;
+            var data = figure.data.slice();
+            var bar = Object.assign({}, data[data.length - 1], {
+                x: order.map(function (row) {
+                    return index[row];
+                }),
+                y: positions,
+                text: names,
+                customdata: order, // store rows of the bars, for recoloring
+            });
+            bar.marker = Object.assign({}, bar.marker, {
+                color: metawatch.tierColors(store, order, role),
+            });
+            data[data.length - 1] = bar;
+            var layout = Object.assign({}, figure.layout, {
+                yaxis: Object.assign({}, figure.layout.yaxis, {
+                    range: [-1, order.length],
+                    tickvals: positions,
+                    ticktext: names,
+                }),
+            });
+            return {data: data, layout: layout};
+        },
+
+        /*
+         * Returns the tier list figure with only the bar colors changed.
+         */
+        recolorTierList: function (current, store, role) {
+            var data = current.data.slice();
+            var bar = Object.assign({}, data[data.length - 1]);
+            bar.marker = Object.assign({}, bar.marker, {
+                color: window.dash_clientside.metawatch.tierColors(
+                    store, bar.customdata, role
+                ),
+            });
+            data[data.length - 1] = bar;
+            return Object.assign({}, current, {data: data});
+        },
+
+        /*
+         * Returns share of runs of each spec within key levels [lower, upper].
+         *
+         * Runs in the bin are cumulative[upper] - cumulative[lower - 1].
+         */
+        specShareInBin: function (store, lower, upper) {
+            var cumulative = window.dash_clientside.metawatch.decode(store.cumulative);
+            var lastPos = cumulative[0].length - 1;
+            var clip = function (position) {
+                return Math.min(Math.max(position, 0), lastPos);
+            };
+            var lowerPos = clip(lower - 1 - store.first_level);
+            var upperPos = clip(upper - store.first_level);
+            var counts = cumulative.map(function (row) {
+                return Math.max(row[upperPos] - row[lowerPos], 0);
+            });
+            var total = counts.reduce(function (sum, count) {
+                return sum + count;
+            }, 0);
+            return counts.map(function (count) {
+                return total === 0 ? 0 : count / total;
+            });
+        },
+
+        /*
+         * Returns a store array as plain JS array(s).
+         *
+         * Arrays may come in plotly's typed-array format ({dtype, bdata,
+         * shape}, see figure.TYPED_ARRAYS); 2D arrays come back as rows.
+         */
+        decode: function (value) {
+            if (!value || value.bdata === undefined) {
+                return value;
+            }
+            var types = {
+                i1: Int8Array,
+                u1: Uint8Array,
+                i2: Int16Array,
+                u2: Uint16Array,
+                i4: Int32Array,
+                u4: Uint32Array,
+                f4: Float32Array,
+                f8: Float64Array,
+            };
+            var binary = atob(value.bdata);
+            var bytes = new Uint8Array(binary.length);
+            for (var i = 0; i < binary.length; i++) {
+                bytes[i] = binary.charCodeAt(i);
+            }
+            var flat = Array.from(new types[value.dtype](bytes.buffer));
+            if (!value.shape) {
+                return flat;
+            }
+            var width = parseInt(String(value.shape).split(",")[1], 10);
+            var rows = [];
+            for (var start = 0; start < flat.length; start += width) {
+                rows.push(flat.slice(start, start + width));
+            }
+            return rows;
+        },
+
+        /*
+         * Returns bar colors: spec color within the role, muted otherwise.
+         */
+        tierColors: function (store, order, role) {
+            return order.map(function (row) {
+                var spec = store.specs[row];
+                return role === "all" || spec.role === role
+                    ? spec.color
+                    : store.muted_color;
+            });
+        },
+    },
+});
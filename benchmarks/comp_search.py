@@ -0,0 +1,214 @@
+"""Compares composition searches with pandas masks and the bitset index.
+
+A synthetic table of valid comps (1 tank, 1 healer, 3 DPS drawn at random)
+stands in for the season-long composition table. Each query is run with the
+pandas boolean masks find_compositions used to build and with
+compsearch.CompositionIndex; both must return the same comps. Pages of
+sorted matches are taken with a full sort_values and with
+CompositionIndex.page.
+
+    Example use (from the repo root):
+
+    python -m benchmarks.comp_search --comps 2000000
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import blizzcolors
+import compsearch
+
+QUERIES = {
+    "no filter": [None, None, None, None, None],
+    "one healer": [None, ["shaman_restoration"], None, None, None],
+    "tank + healer": [["druid_guardian"], ["shaman_restoration"], None, None, None],
+    "any of 3 tanks": [
+        ["druid_guardian", "monk_brewmaster", "paladin_protection"],
+        None,
+        None,
+        None,
+        None,
+    ],
+    "double dps": [None, None, ["mage_frost"], ["mage_frost"], None],
+    "full comp": [
+        ["demon_hunter_vengeance"],
+        ["priest_discipline", "druid_restoration"],
+        ["mage_frost"],
+        ["rogue_outlaw", "rogue_subtlety"],
+        ["shaman_elemental", "warlock_destruction", "priest_shadow"],
+    ],
+}
+
+
+def synthetic_compositions(n_comps: int, seed: int = 0) -> pd.DataFrame:
+    """Returns n_comps random comps: run stats and one int8 column per spec."""
+    specs = blizzcolors.Specs().specs
+    roles = np.array([spec["role"] for spec in specs])
+    tanks = np.flatnonzero(roles == "tank")
+    healers = np.flatnonzero(roles == "healer")
+    dps = np.flatnonzero(np.isin(roles, ["mdps", "rdps"]))
+    rng = np.random.default_rng(seed)
+    members = np.column_stack(
+        [
+            rng.choice(tanks, n_comps),
+            rng.choice(healers, n_comps),
+            rng.choice(dps, (n_comps, 3)),
+        ]
+    )
+    counts = np.zeros((n_comps, len(specs)), dtype=np.int8)
+    rows = np.repeat(np.arange(n_comps), members.shape[1])
+    np.add.at(counts, (rows, members.ravel()), 1)
+    composition = pd.DataFrame(counts, columns=[spec["token"] for spec in specs])
+    # the table comes ordered by run_count; many comps share small counts
+    run_count = np.sort(rng.zipf(1.5, n_comps).clip(max=10**6))[::-1]
+    level_max = rng.integers(2, 31, n_comps)
+    stats = pd.DataFrame(
+        dict(
+            run_count=run_count.astype(np.int32),
+            level_mean=(level_max * rng.uniform(0.6, 1, n_comps)).astype(np.float32),
+            level_max=level_max.astype(np.int16),
+        )
+    )
+    return pd.concat([stats, composition], axis=1)
+
+
+def pandas_masks(composition: pd.DataFrame, fields: List) -> np.ndarray:
+    """Returns row ids of matching comps the way find_compositions used to."""
+    fields = [field for field in fields if field]
+    mask = pd.Series(True, index=composition.index)
+    for field in fields:
+        if len(field) > 1:
+            field_mask = composition[field[0]] > 0
+            for spec in field[1:]:
+                field_mask = field_mask | (composition[spec] > 0)
+        else:
+            field_mask = composition[field[0]] >= fields.count(field)
+        mask = mask & field_mask
+    matches = composition[mask].copy(deep=True)
+    return matches.index.to_numpy()  # row ids, the table has a RangeIndex
+
+
+def pandas_page(
+    composition: pd.DataFrame, fields: List, sortby: str, page: int
+) -> np.ndarray:
+    """Returns row ids of a page of 50 sorted matches with a full sort."""
+    matches = composition.iloc[pandas_masks(composition, fields)]
+    matches = matches.sort_values(
+        by=compsearch.SORT_ORDERS[sortby], axis=0, ascending=False
+    )
+    return matches[50 * page : 50 * page + 50].index.to_numpy()
+
+
+def index_page(
+    index: compsearch.CompositionIndex, fields: List, sortby: str, page: int
+) -> np.ndarray:
+    """Returns row ids of a page of 50 sorted matches from the index."""
+    return index.page(index.match(fields), sortby, 50 * page, 50 * page + 50)
+
+
+def _time(function: Callable, repeat: int) -> Tuple[float, object]:
+    """Returns mean seconds of function() and its last result."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def run(n_comps: int = 2000000, repeat: int = 5) -> Dict:
+    """Builds the index over a synthetic table and times every query.
+
+    Returns
+    -------
+    results : dict
+        'build' seconds, index 'bytes', 'queries':
+        name -> (pandas seconds, index seconds, bitset seconds, matches),
+        where bitset seconds leave out turning the bitset into row ids, and
+        'pages': (query name, sort order, page) -> (pandas s, index s)
+    """
+    composition = synthetic_compositions(n_comps)
+    build_seconds, index = _time(
+        lambda: compsearch.CompositionIndex.from_compositions(composition), 1
+    )
+    queries = {}
+    for name, fields in QUERIES.items():
+        pandas_seconds, expected = _time(
+            lambda: pandas_masks(composition, fields), repeat
+        )
+        index_seconds, rows = _time(lambda: index.find(fields), repeat)
+        bitset_seconds, _ = _time(lambda: index.match(fields), repeat)
+        if not np.array_equal(expected, rows):
+            raise AssertionError("index and pandas masks disagree on %s" % name)
+        queries[name] = (pandas_seconds, index_seconds, bitset_seconds, len(rows))
+    pages = {}
+    for name in ["no filter", "one healer", "double dps"]:
+        for sortby in ["total", "max+total+avg"]:
+            for page in [0, 39]:
+                fields = QUERIES[name]
+                pandas_seconds, expected = _time(
+                    lambda: pandas_page(composition, fields, sortby, page), repeat
+                )
+                index_seconds, rows = _time(
+                    lambda: index_page(index, fields, sortby, page), repeat
+                )
+                if not np.array_equal(expected, rows):
+                    raise AssertionError(
+                        "index and sort_values disagree on %s" % sortby
+                    )
+                pages[(name, sortby, page)] = (pandas_seconds, index_seconds)
+    return dict(build=build_seconds, bytes=index.nbytes, queries=queries, pages=pages)
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--comps", type=int, default=2000000, help="table size")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per query")
+    args = parser.parse_args()
+    results = run(args.comps, args.repeat)
+    print(
+        "%d comps: index built in %.2f s, %.1f MB"
+        % (args.comps, results["build"], results["bytes"] / 2**20)
+    )
+    print(
+        "%-16s %12s %12s %12s %8s %10s"
+        % ("query", "pandas", "index", "bitset only", "speedup", "matches")
+    )
+    for name, query in results["queries"].items():
+        pandas_seconds, index_seconds, bitset_seconds, matches = query
+        print(
+            "%-16s %9.1f ms %9.1f ms %9.2f ms %7.1fx %10d"
+            % (
+                name,
+                1000 * pandas_seconds,
+                1000 * index_seconds,
+                1000 * bitset_seconds,
+                pandas_seconds / index_seconds,
+                matches,
+            )
+        )
+    print(
+        "%-16s %14s %5s %12s %12s %8s"
+        % ("query", "sort", "page", "sort_values", "index", "speedup")
+    )
+    for (name, sortby, page), (pandas_seconds, index_seconds) in results[
+        "pages"
+    ].items():
+        print(
+            "%-16s %14s %5d %9.1f ms %9.2f ms %7.1fx"
+            % (
+                name,
+                sortby,
+                page + 1,
+                1000 * pandas_seconds,
+                1000 * index_seconds,
+                pandas_seconds / index_seconds,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
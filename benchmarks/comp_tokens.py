@@ -0,0 +1,95 @@
+"""Compares row-wise and vectorized decoding of comp tokens.
+
+Random 5-member tokens (a few of them invalid comps) are decoded with
+blizzcolors.decode_comp_tokens and checked with blizzcolors.comp_masks. The
+row-wise DataFrame.apply decoding vectorize_comps used to do is timed on a
+sample and extrapolated; both must give the same spec frequencies.
+
+    Example use (from the repo root):
+
+    python -m benchmarks.comp_tokens --tokens 10000000
+"""
+
+import argparse
+import time
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+import blizzcolors
+
+
+def synthetic_tokens(n_tokens: int, seed: int = 0) -> np.ndarray:
+    """Returns n_tokens random 5-member comp tokens as python strings."""
+    chars = np.array([ord(spec[6]) for spec in blizzcolors.Specs.get_specs()])
+    rng = np.random.default_rng(seed)
+    members = rng.choice(chars, (n_tokens, 5)).astype(np.uint8)
+    return members.view("S5").ravel().astype(str).astype(object)
+
+
+def row_wise(composition: pd.DataFrame) -> np.ndarray:
+    """Decodes tokens the way vectorize_comps used to, one row at a time."""
+    specs = blizzcolors.Specs.get_specs()
+
+    def vectorize_comp_token(token):
+        spec_index = dict(zip([spec[-2] for spec in specs], range(len(specs))))
+        vector = [0] * len(specs)
+        for spec_char in token:
+            vector[spec_index[spec_char]] += 1
+        return vector
+
+    comp_matrix = composition.apply(
+        lambda row: vectorize_comp_token(row["composition"]), axis=1
+    )
+    return pd.DataFrame(comp_matrix.values.tolist(), dtype=np.int8).to_numpy()
+
+
+def run(n_tokens: int = 10000000, n_sample: int = 100000) -> Dict:
+    """Times both decoders.
+
+    Returns
+    -------
+    results : dict
+        'row_wise' seconds (extrapolated from the sample), 'decode' and
+        'masks' seconds for all tokens, and 'valid' comps
+    """
+    tokens = synthetic_tokens(n_tokens)
+    sample = pd.DataFrame(dict(composition=tokens[:n_sample]))
+    start = time.perf_counter()
+    expected = row_wise(sample)
+    row_wise_seconds = (time.perf_counter() - start) * n_tokens / len(sample)
+    start = time.perf_counter()
+    comp_matrix = blizzcolors.decode_comp_tokens(tokens)
+    decode_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    five_members, one_tank, one_healer = blizzcolors.comp_masks(comp_matrix)
+    masks_seconds = time.perf_counter() - start
+    if not np.array_equal(expected, comp_matrix[: len(sample)]):
+        raise AssertionError("row-wise and vectorized decoding disagree")
+    return dict(
+        row_wise=row_wise_seconds,
+        decode=decode_seconds,
+        masks=masks_seconds,
+        valid=int((five_members & one_tank & one_healer).sum()),
+    )
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--tokens", type=int, default=10000000, help="tokens")
+    parser.add_argument(
+        "--sample", type=int, default=100000, help="tokens decoded row-wise"
+    )
+    args = parser.parse_args()
+    results = run(args.tokens, args.sample)
+    print("%d tokens (%d valid comps)" % (args.tokens, results["valid"]))
+    print("row-wise apply     %8.2f s (extrapolated)" % results["row_wise"])
+    print("decode_comp_tokens %8.2f s" % results["decode"])
+    print("comp_masks         %8.2f s" % results["masks"])
+    print("speedup            %8.1fx" % (results["row_wise"] / results["decode"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Compares validated (go.Figure) and lean (plain dict) figure building.
+
+Each figure of the specs page is built and dumped to JSON, the way Dash
+sends it to the browser, in both modes of figure.VALIDATE_FIGURES; both
+modes must give the same figure.
+
+    Example use (from the repo root):
+
+    python -m benchmarks.figure_modes data/example_summary.sqlite
+"""
+
+import argparse
+import base64
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+import dataserver
+import figure
+
+
+def figure_builders(
+    dataserver_: dataserver.DataServer, season: str
+) -> List[Tuple[str, Callable]]:
+    """Returns (name, build) pairs for the figures of one season."""
+    runs_per_spec = dataserver_.get_data_for_ridgeplot(season)
+    runs_per_level = dataserver_.get_data_for_run_histogram(season)
+    runs_per_week = dataserver_.get_data_for_weekly_chart()
+    cumulative = dataserver_.get_data_for_meta_index(season)
+    return [
+        ("ridgeplot", lambda: figure.RidgePlot(runs_per_spec, season).figure),
+        ("bubbles", lambda: figure.BubblePlot(runs_per_spec, season).make_figure2()),
+        (
+            "histogram",
+            lambda: figure.BasicHistogram(runs_per_level, season).make_figure(),
+        ),
+        (
+            "stacked key",
+            lambda: figure.StackedBarChart(
+                runs_per_spec, "key", "mdps", season
+            ).assemble_figure(),
+        ),
+        (
+            "stacked week",
+            lambda: figure.StackedBarChart(
+                runs_per_week, "week", "mdps", season
+            ).assemble_figure(),
+        ),
+        (
+            "tier list",
+            lambda: figure.MetaIndexBarChart(cumulative, "all").create_figure(
+                [2, 30, 16, 30]
+            ),
+        ),
+    ]
+
+
+def decode_figure(value: Any) -> Any:
+    """Returns figure JSON with typed arrays decoded into plain lists.
+
+    Typed arrays ({"dtype", "bdata"}) become lists and floats are compared at
+    float32 precision, the precision lean typed arrays store them with, so
+    JSON from both modes compares equal when the figures are the same.
+    """
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            array = np.frombuffer(base64.b64decode(value["bdata"]), value["dtype"])
+            if "shape" in value:
+                array = array.reshape([int(n) for n in str(value["shape"]).split(",")])
+            return decode_figure(array.tolist())
+        return {key: decode_figure(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_figure(item) for item in value]
+    if isinstance(value, float):
+        if value != value:
+            return None  # NaN is dumped as null by plotly
+        value = float(np.float32(value))
+        return int(value) if value.is_integer() else value
+    return value
+
+
+def _time_build(build: Callable, repeat: int) -> float:
+    """Returns mean seconds to build a figure and dump it to JSON."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build().to_json()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(db_file_path: str, season: str = None, repeat: int = 20) -> Dict:
+    """Times every figure in both modes.
+
+    Returns
+    -------
+    timings : dict
+        figure name -> (validated seconds, lean seconds)
+    """
+    dataserver_ = dataserver.DataServer(db_file_path)
+    season = season or dataserver_.get_seasons()[-1]
+    validate_figures = figure.VALIDATE_FIGURES
+    timings = {}
+    try:
+        for name, build in figure_builders(dataserver_, season):
+            figure.VALIDATE_FIGURES = True
+            validated = _time_build(build, repeat)
+            expected = decode_figure(json.loads(build().to_json()))
+            figure.VALIDATE_FIGURES = False
+            lean = _time_build(build, repeat)
+            if decode_figure(json.loads(build().to_json())) != expected:
+                raise AssertionError("validated and lean %s disagree" % name)
+            timings[name] = (validated, lean)
+    finally:
+        figure.VALIDATE_FIGURES = validate_figures
+    return timings
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("db_file_path", help="path to the summary SQLite db")
+    parser.add_argument("--season", default=None, help="season to draw")
+    parser.add_argument("--repeat", type=int, default=20, help="builds per figure")
+    args = parser.parse_args()
+    timings = run(args.db_file_path, args.season, args.repeat)
+    print("%-14s %12s %12s %8s" % ("figure", "validated", "lean", "speedup"))
+    for name, (validated, lean) in timings.items():
+        print(
+            "%-14s %9.1f ms %9.1f ms %7.1fx"
+            % (name, 1000 * validated, 1000 * lean, validated / lean)
+        )
+    validated = sum(validated for validated, _ in timings.values())
+    lean = sum(lean for _, lean in timings.values())
+    print(
+        "%-14s %9.1f ms %9.1f ms %7.1fx"
+        % ("total", 1000 * validated, 1000 * lean, validated / lean)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Measures figure payload size and parse time with and without typed arrays.
+
+Each specs page figure (and the client-side stores of figures 2-4) is built
+in lean mode and dumped to JSON once with numeric arrays as number lists and
+once in plotly's base64 typed-array format (figure.TYPED_ARRAYS). Parse time
+is the time to json.loads the payload, a stand-in for JSON.parse in the
+browser; decoding a typed array there is a single copy into a typed view.
+
+    Example use (from the repo root):
+
+    python -m benchmarks.figure_payload data/example_summary.sqlite
+"""
+
+import argparse
+import gzip
+import json
+import time
+from typing import Callable, Dict, List, Tuple
+
+import dataserver
+import figure
+from benchmarks.figure_modes import figure_builders
+
+
+def _store_builders(
+    dataserver_: dataserver.DataServer, season: str
+) -> List[Tuple[str, Callable]]:
+    """Returns (name, build) pairs for the client-side stores of one season."""
+    runs_per_spec = dataserver_.get_data_for_ridgeplot(season)
+    runs_per_week = dataserver_.get_data_for_weekly_chart()
+    cumulative = dataserver_.get_data_for_meta_index(season)
+    return [
+        (
+            "figure2 store",
+            lambda: figure.stacked_chart_store(runs_per_spec, "key", season),
+        ),
+        (
+            "figure3 store",
+            lambda: figure.stacked_chart_store(runs_per_week, "week", season),
+        ),
+        (
+            "figure4 store",
+            lambda: figure.MetaIndexBarChart(cumulative, "all").to_store(season),
+        ),
+    ]
+
+
+def _measure(payload: str, repeat: int) -> Tuple[int, int, float]:
+    """Returns raw bytes, gzipped bytes and mean seconds to parse payload."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        json.loads(payload)
+    parse_seconds = (time.perf_counter() - start) / repeat
+    encoded = payload.encode()
+    return len(encoded), len(gzip.compress(encoded)), parse_seconds
+
+
+def run(db_file_path: str, season: str = None, repeat: int = 20) -> Dict:
+    """Measures every figure and store with number lists and typed arrays.
+
+    Returns
+    -------
+    measurements : dict
+        name -> {"lists": (bytes, gzip bytes, parse s), "typed": (...)}
+    """
+    dataserver_ = dataserver.DataServer(db_file_path)
+    season = season or dataserver_.get_seasons()[-1]
+    builders = figure_builders(dataserver_, season)
+    builders += _store_builders(dataserver_, season)
+    validate_figures, typed_arrays = figure.VALIDATE_FIGURES, figure.TYPED_ARRAYS
+    measurements = {}
+    try:
+        figure.VALIDATE_FIGURES = False
+        for name, build in builders:
+            measurements[name] = {}
+            for mode, typed in [("lists", False), ("typed", True)]:
+                figure.TYPED_ARRAYS = typed
+                built = build()
+                if hasattr(built, "to_json"):
+                    payload = built.to_json()
+                else:
+                    payload = json.dumps(built)
+                measurements[name][mode] = _measure(payload, repeat)
+    finally:
+        figure.VALIDATE_FIGURES, figure.TYPED_ARRAYS = validate_figures, typed_arrays
+    return measurements
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("db_file_path", help="path to the summary SQLite db")
+    parser.add_argument("--season", default=None, help="season to draw")
+    parser.add_argument("--repeat", type=int, default=20, help="parses per payload")
+    args = parser.parse_args()
+    measurements = run(args.db_file_path, args.season, args.repeat)
+    print("%-14s %17s %17s %19s" % ("payload", "KB lists/typed", "gzip KB", "parse ms"))
+    for name, modes in measurements.items():
+        lists, typed = modes["lists"], modes["typed"]
+        print(
+            "%-14s %8.1f %8.1f %8.1f %8.1f %9.2f %9.2f"
+            % (
+                name,
+                lists[0] / 1024,
+                typed[0] / 1024,
+                lists[1] / 1024,
+                typed[1] / 1024,
+                1000 * lists[2],
+                1000 * typed[2],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 """Container for Blizzard class colors."""
 
-from typing import List
+from typing import List, Tuple
 
+import numpy as np
 import pandas as pd
 
 
@@ -117,13 +118,7 @@ class Specs:
         vector : list[int]
             vector encoding of the spec frequencies in the token
         """
-        specs = self.get_specs()
-        spec_index = dict(zip([spec[-2] for spec in specs], range(len(specs))))
-        vector = [0] * len(specs)
-        for spec_char in token:
-            index = spec_index[spec_char]
-            vector[index] += 1
-        return vector
+        return decode_comp_tokens([token])[0].tolist()
 
     @staticmethod
     def get_specs():
@@ -170,6 +165,77 @@ class Specs:
         # fmt: on
 
 
+def _make_token_lookup() -> np.ndarray:
+    """Maps each byte to its spec index; padding (0) to the extra column."""
+    specs = Specs.get_specs()
+    lookup = np.full(256, -1, dtype=np.int8)  # -1: not a spec character
+    lookup[0] = len(specs)
+    for index, spec in enumerate(specs):
+        lookup[ord(spec[6])] = index
+    return lookup
+
+
+# byte of a comp token character -> spec index (row of Specs.get_specs())
+_TOKEN_LOOKUP = _make_token_lookup()
+
+
+def decode_comp_tokens(tokens) -> np.ndarray:
+    """Converts comp tokens to spec frequency vectors in one NumPy pass.
+
+    Tokens are packed into a fixed-width byte matrix (zero padded), mapped
+    through a byte -> spec index lookup table and counted column by column.
+
+    Parameter
+    ---------
+    tokens : sequence of str
+        strings of characters a-zA-K where each char corresponds to a
+        player spec
+
+    Returns
+    -------
+    comp_matrix : np.ndarray
+        (n_tokens, 36) int8 spec frequencies, columns in Specs().specs order
+    """
+    num_specs = len(Specs.get_specs())
+    tokens = np.asarray(tokens, dtype=bytes)
+    comp_matrix = np.zeros((len(tokens), num_specs + 1), dtype=np.int8)
+    if len(tokens) == 0:
+        return comp_matrix[:, :num_specs]
+    chars = tokens.view(np.uint8).reshape(len(tokens), tokens.dtype.itemsize)
+    spec_index = _TOKEN_LOOKUP[chars]
+    if (spec_index < 0).any():
+        raise ValueError("comp token has a character that is not a spec")
+    # flat offset of each row; one spec per row and position, so no offset
+    # repeats within a pass
+    flat = comp_matrix.reshape(-1)
+    row_offsets = np.arange(0, comp_matrix.size, num_specs + 1)
+    for position in range(chars.shape[1]):
+        flat[row_offsets + spec_index[:, position]] += 1
+    return comp_matrix[:, :num_specs]
+
+
+def comp_masks(comp_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Checks comps for 5 members, exactly 1 tank and exactly 1 healer.
+
+    Parameter
+    ---------
+    comp_matrix : np.ndarray
+        (n_comps, 36) spec frequencies, see decode_comp_tokens
+
+    Returns
+    -------
+    five_members, one_tank, one_healer : np.ndarray
+        bool mask of comps passing each check
+    """
+    roles = np.array([spec[4] for spec in Specs.get_specs()])
+    comp_matrix = np.asarray(comp_matrix)
+    # a comp has at most a handful of members, so int8 sums cannot overflow
+    five_members = comp_matrix.sum(axis=1, dtype=np.int8) == 5
+    one_tank = comp_matrix[:, roles == "tank"].sum(axis=1, dtype=np.int8) == 1
+    one_healer = comp_matrix[:, roles == "healer"].sum(axis=1, dtype=np.int8) == 1
+    return five_members, one_tank, one_healer
+
+
 def vectorize_comps(composition: pd.DataFrame) -> pd.DataFrame:
     """Appends vector representation of each comp to the composition df.
 
@@ -183,15 +249,15 @@ def vectorize_comps(composition: pd.DataFrame) -> pd.DataFrame:
     Returns
     -------
     composition_vectorized : pd.DataFrame
-        original dataframe, plus 36 columns encoding spec frequencies
+        original dataframe, plus 36 int8 columns encoding spec frequencies
         for each comp
     """
     spec_util = Specs()
-    comp_matrix = composition.apply(
-        lambda row: spec_util.vectorize_comp_token(row["composition"]), axis=1
+    comp_matrix = pd.DataFrame(
+        decode_comp_tokens(composition["composition"].to_numpy()),
+        index=composition.index,
+        columns=[spec["token"] for spec in spec_util.specs],
     )
-    comp_matrix = pd.DataFrame(comp_matrix.values.tolist())
-    comp_matrix.columns = [spec["token"] for spec in spec_util.specs]
     composition_vectorized = pd.concat([composition, comp_matrix], axis=1)
     return composition_vectorized
 
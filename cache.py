@@ -0,0 +1,297 @@
+"""Caches shared by the data server and the apps.
+
+LRUCache lives in one process, DiskCache is shared by all workers on a host.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache.
+
+    Example use:
+
+    lru = cache.LRUCache(maxsize=32)
+    value = lru.get_or_compute(key, lambda: expensive(key))
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        """Inits an empty cache.
+
+        Parameters
+        ----------
+        maxsize : int
+            max number of entries; the least recently used entry is evicted
+            once the cache is full
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compute_seconds = 0.0  # time spent in get_or_compute on misses
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns cached value for key (and marks it as recently used)."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores value under key, evicting the least recently used entry."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Returns cached value for key, computing and storing it on a miss.
+
+        The value is computed outside the lock, so two threads missing on the
+        same key at once may both compute it; the last one wins.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            start = time.perf_counter()
+            value = compute()
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.compute_seconds += seconds
+            self.put(key, value)
+        return value
+
+    def values(self) -> List[Any]:
+        """Returns cached values, least recently used first."""
+        with self._lock:
+            return list(self._data.values())
+
+    def clear(self) -> None:
+        """Drops all entries (the counters are kept)."""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Returns size, hit/miss/eviction counts, hit rate and compute time.
+
+        compute_seconds is the total time get_or_compute spent on misses,
+        mean_compute_seconds the average cost of a miss (what a hit saves).
+        """
+        with self._lock:
+            size, hits, misses = len(self._data), self.hits, self.misses
+            evictions, compute_seconds = self.evictions, self.compute_seconds
+        lookups = hits + misses
+        return {
+            "size": size,
+            "maxsize": self.maxsize,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "compute_seconds": compute_seconds,
+            "mean_compute_seconds": compute_seconds / misses if misses else 0.0,
+        }
+
+
+class DiskCache:
+    """Size-capped key/value store of JSON values in a local SQLite file.
+
+    Every worker process on the host opens the same file, so a value
+    computed by one worker is served to all of them, and survives restarts.
+    Entries are stored per data version; entries of older versions are
+    dropped as soon as a newer version is written.
+
+    Example use:
+
+    disk = cache.DiskCache("data/summary.figures.sqlite", max_bytes=2**28)
+    value = disk.get_or_compute(key, version, lambda: expensive(key))
+    """
+
+    def __init__(
+        self, path: str, max_bytes: int = 2**28, touch_seconds: float = 60.0
+    ) -> None:
+        """Inits the store; the file is opened (and created) on first use.
+
+        Parameters
+        ----------
+        path : str
+            path to the SQLite file of the store
+        max_bytes : int
+            max total size of stored values; the least recently used
+            entries are evicted once the store is larger
+        touch_seconds : float
+            a hit refreshes the entry's last access time only if it is older
+            than this, so most hits are reads that do not lock the file
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_seconds = touch_seconds
+        self._lock = threading.Lock()
+        # one connection per process: a connection must not be used across
+        # fork, e.g. when the app is preloaded by gunicorn
+        self._conn = None
+        self._pid = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compute_seconds = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the connection of this process, opening it on first use."""
+        if self._pid != os.getpid():
+            # autocommit; other workers write to the same file concurrently
+            conn = sqlite3.connect(
+                self.path, timeout=10.0, check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT, version INTEGER, value TEXT, size INTEGER, accessed REAL, "
+                "PRIMARY KEY (key, version))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+            )
+            # running total of stored bytes, kept by triggers for all workers
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS total (id INTEGER PRIMARY KEY, size INTEGER)"
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO total "
+                "SELECT 0, COALESCE(SUM(size), 0) FROM entries"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries "
+                "BEGIN UPDATE total SET size = size + new.size; END"
+            )
+            conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries "
+                "BEGIN UPDATE total SET size = size - old.size; END"
+            )
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def get(self, key: str, version: int, default: Any = None) -> Any:
+        """Returns stored value for key and data version."""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, accessed FROM entries WHERE key=? AND version=?",
+                (key, version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            now = time.time()
+            if now - row[1] > self.touch_seconds:
+                conn.execute(
+                    "UPDATE entries SET accessed=? WHERE key=? AND version=?",
+                    (now, key, version),
+                )
+        return json.loads(row[0])
+
+    def put(self, key: str, version: int, value: Any) -> None:
+        """Stores JSON-serializable value, then evicts stale and excess entries."""
+        text = json.dumps(value)
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # delete + insert rather than REPLACE, which skips the triggers
+                conn.execute(
+                    "DELETE FROM entries WHERE key=? AND version=?", (key, version)
+                )
+                conn.execute(
+                    "INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                    (key, version, text, len(text), time.time()),
+                )
+                stale = conn.execute(
+                    "DELETE FROM entries WHERE version < ?", (version,)
+                ).rowcount
+                self.evictions += stale
+                self._evict_to_size(conn)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _evict_to_size(self, conn: sqlite3.Connection) -> None:
+        """Drops least recently used entries until the store fits max_bytes.
+
+        Only the running total is read unless the store is over the limit;
+        then the oldest entries are read until enough bytes are freed.
+        """
+        excess = conn.execute("SELECT size FROM total").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evict = []
+        for key, version, size in conn.execute(
+            "SELECT key, version, size FROM entries ORDER BY accessed"
+        ):
+            evict.append((key, version))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM entries WHERE key=? AND version=?", evict)
+        self.evictions += len(evict)
+
+    def get_or_compute(self, key: str, version: int, compute: Callable[[], Any]) -> Any:
+        """Returns stored value, computing and storing it on a miss.
+
+        The value goes through JSON both ways, so tuples come back as lists.
+        """
+        missing = object()
+        value = self.get(key, version, missing)
+        if value is missing:
+            start = time.perf_counter()
+            value = compute()
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.compute_seconds += seconds
+            self.put(key, version, value)
+        return value
+
+    def stats(self) -> Dict[str, float]:
+        """Returns stored bytes/entries, hit/miss/eviction counts and hit rate.
+
+        Counts are for this process; the stored entries are shared.
+        """
+        with self._lock:
+            entries, size = (
+                self._connection()
+                .execute("SELECT COUNT(*), (SELECT size FROM total) FROM entries")
+                .fetchone()
+            )
+            hits, misses = self.hits, self.misses
+            evictions, compute_seconds = self.evictions, self.compute_seconds
+        lookups = hits + misses
+        return {
+            "size": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "compute_seconds": compute_seconds,
+        }
@@ -0,0 +1,262 @@
+"""Inverted bitset index for the composition explorer search.
+
+Every (spec, count) pair gets a packed bitset over all valid comps: bit i is
+set when comp i has at least count members of the spec. A slot query is then
+a few vectorized bitwise ops over n_comps / 8 bytes each. The sort orders of
+the explorer are precomputed as permutations, so a page of sorted matches
+costs about the same for page 1 and page 300.
+
+    Example use:
+
+    index = compsearch.CompositionIndex.from_compositions(composition)
+    rows = index.find([["druid_guardian"], ["shaman_restoration", "paladin_holy"]])
+    matches = composition.iloc[rows]
+    # or the 2nd page of 50 matches, best first
+    bitset = index.match([["druid_guardian"]])
+    rows = index.page(bitset, "total", 50, 100)
+    # or through a result that can be cached and paged by slicing
+    result = index.search(*canonical_query([["druid_guardian"]], "total"))
+    rows = result.page(50, 100)
+"""
+
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import blizzcolors
+
+# sort orders of the explorer: columns, sorted in descending order
+SORT_ORDERS = {
+    "max+total+avg": ["level_max", "run_count", "level_mean"],
+    "max+avg+total": ["level_max", "level_mean", "run_count"],
+    "total": ["run_count", "level_mean"],
+    "avg": ["level_mean", "run_count"],
+}
+
+# number of set bits of each byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+# sorted matches kept by a SearchResult; later pages come from the index
+MAX_RESULT_ROWS = 20000
+
+
+def canonical_query(
+    fields: List[Optional[List[str]]], sortby: str
+) -> Tuple[Tuple[Hashable, ...], str]:
+    """Returns (fields, sortby) equal for queries with the same results.
+
+    Slots match regardless of their position (see CompositionIndex.match),
+    so the slots become an unordered multiset of sorted spec tuples; empty
+    slots are dropped.
+    """
+    fields = tuple(sorted(tuple(sorted(field)) for field in fields if field))
+    return fields, sortby
+
+
+def sort_permutation(composition: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """Returns row ids sorted by columns in descending order.
+
+    Same order as composition.sort_values(by=columns, ascending=False): ties
+    keep their order in the table.
+    """
+    # lexsort sorts by the last key first; negated keys sort descending
+    keys = [-composition[column].to_numpy() for column in reversed(columns)]
+    return np.lexsort(keys).astype(np.int32)
+
+
+class SearchResult:
+    """Matches of one query in sort order.
+
+    The first MAX_RESULT_ROWS sorted row ids are kept, so their pages are
+    slices; pages past them are taken from the index.
+    """
+
+    def __init__(
+        self,
+        index: "CompositionIndex",
+        bitset: np.ndarray,
+        sortby: str,
+        max_rows: int = MAX_RESULT_ROWS,
+    ) -> None:
+        """Inits with the bitset of matches of the query."""
+        self.count = index.count(bitset)
+        self.rows = index.page(bitset, sortby, 0, max_rows)
+        self._index = None
+        if self.count > len(self.rows):
+            # remembered only for pages past the kept rows
+            self._index, self._bitset, self._sortby = index, bitset, sortby
+
+    def page(self, start: int, stop: int) -> np.ndarray:
+        """Returns row ids of sorted matches start..stop-1."""
+        if stop <= len(self.rows) or self._index is None:
+            return self.rows[start:stop]
+        return self._index.page(self._bitset, self._sortby, start, stop)
+
+
+class CompositionIndex:
+    """Packed (spec, min count) bitsets over a table of vectorized comps."""
+
+    def __init__(
+        self,
+        counts: np.ndarray,
+        tokens: List[str],
+        orders: Optional[Dict[str, np.ndarray]] = None,
+    ) -> None:
+        """Inits with spec counts of each comp.
+
+        Parameters
+        ----------
+        counts : np.ndarray
+            (n_comps, n_specs) number of members of each spec in each comp
+        tokens : list[str]
+            spec token of each column of counts
+        orders : dict, optional
+            sort order name -> permutation of row ids, best comp first
+        """
+        counts = np.asarray(counts)
+        self.size = counts.shape[0]
+        self.columns: Dict[str, int] = {token: col for col, token in enumerate(tokens)}
+        self.max_count = max(int(counts.max(initial=0)), 1)
+        # bitsets[col, count - 1] = comps with at least count members of spec
+        by_spec = np.ascontiguousarray(counts.T)
+        self.bitsets = np.stack(
+            [
+                np.packbits(by_spec >= count, axis=1, bitorder="little")
+                for count in range(1, self.max_count + 1)
+            ],
+            axis=1,
+        )
+        self.all_comps = np.packbits(np.ones(self.size, dtype=bool), bitorder="little")
+        self.orders = orders or {}
+        # ranks[name][row] = position of the row in the order
+        self.ranks = {}
+        for name, order in self.orders.items():
+            ranks = np.empty(self.size, dtype=np.int32)
+            ranks[order] = np.arange(self.size, dtype=np.int32)
+            self.ranks[name] = ranks
+
+    @classmethod
+    def from_compositions(cls, composition: pd.DataFrame) -> "CompositionIndex":
+        """Builds the index from vectorize_comps output, with SORT_ORDERS."""
+        tokens = [spec["token"] for spec in blizzcolors.Specs().specs]
+        orders = {
+            name: sort_permutation(composition, columns)
+            for name, columns in SORT_ORDERS.items()
+        }
+        return cls(composition[tokens].to_numpy(), tokens, orders)
+
+    @property
+    def nbytes(self) -> int:
+        """Returns memory held by the bitsets and sort orders."""
+        orders = sum(order.nbytes for order in self.orders.values())
+        ranks = sum(ranks.nbytes for ranks in self.ranks.values())
+        return self.bitsets.nbytes + self.all_comps.nbytes + orders + ranks
+
+    def at_least(self, token: str, count: int) -> np.ndarray:
+        """Returns bitset of comps with at least count members of spec."""
+        if count > self.max_count:
+            return np.zeros_like(self.all_comps)
+        return self.bitsets[self.columns[token], count - 1]
+
+    def any_of(self, tokens: List[str]) -> np.ndarray:
+        """Returns bitset of comps with at least one member of any spec."""
+        cols = [self.columns[token] for token in tokens]
+        return np.bitwise_or.reduce(self.bitsets[cols, 0], axis=0)
+
+    def match(self, fields: List[Optional[List[str]]]) -> np.ndarray:
+        """Returns bitset of comps that match all slot selections.
+
+        Parameters
+        ----------
+        fields : list
+            spec tokens selected in each party slot; a slot with several
+            specs matches any of them, empty slots match everything, and a
+            single spec selected in k slots needs k members of that spec
+
+        Returns
+        -------
+        bitset : np.ndarray
+            packed (little bit order) uint8 mask over comps
+        """
+        fields = [field for field in fields if field]
+        matched = self.all_comps
+        for field in fields:
+            if len(field) > 1:
+                field_bits = self.any_of(field)
+            else:
+                field_bits = self.at_least(field[0], fields.count(field))
+            matched = matched & field_bits
+        return matched
+
+    def to_rows(self, bitset: np.ndarray) -> np.ndarray:
+        """Returns row ids (ascending) of comps set in bitset."""
+        nonzero = np.flatnonzero(bitset)
+        if 4 * len(nonzero) > len(bitset):
+            mask = np.unpackbits(bitset, count=self.size, bitorder="little")
+            return np.flatnonzero(mask)
+        # sparse matches: only bytes with a set bit are unpacked; padding bits
+        # past the last comp are never set
+        bits = np.unpackbits(bitset[nonzero, np.newaxis], axis=1, bitorder="little")
+        rows = 8 * nonzero[:, np.newaxis] + np.arange(8)
+        return rows[bits.view(bool)]
+
+    def find(self, fields: List[Optional[List[str]]]) -> np.ndarray:
+        """Returns row ids (ascending) of comps that match slot selections."""
+        return self.to_rows(self.match(fields))
+
+    def count(self, bitset: np.ndarray) -> int:
+        """Returns number of comps set in bitset."""
+        return int(_POPCOUNT[bitset].sum(dtype=np.int64))
+
+    @staticmethod
+    def _contains(bitset: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Returns bool mask of rows set in bitset."""
+        return ((bitset[rows >> 3] >> (rows & 7)) & 1).astype(bool)
+
+    def page(self, bitset: np.ndarray, sortby: str, start: int, stop: int):
+        """Returns row ids of sorted matches start..stop-1, without a full sort.
+
+        Parameters
+        ----------
+        bitset : np.ndarray
+            matches, see match()
+        sortby : str
+            name of the sort order, see SORT_ORDERS
+        start, stop : int
+            positions of the page among the sorted matches
+
+        Returns
+        -------
+        rows : np.ndarray
+            row ids in sort order; shorter than stop - start at the end
+        """
+        count = self.count(bitset)
+        stop = min(stop, count)
+        if start >= stop:
+            return np.empty(0, dtype=np.int32)
+        order = self.orders[sortby]
+        if stop * self.size < count * count:
+            # dense matches: walk the sort order until stop matches are found,
+            # about stop * size / count rows, less than there are matches
+            chunk = int(1.25 * stop * self.size / count) + 1024
+            hits = []
+            found = 0
+            for position in range(0, self.size, chunk):
+                candidates = order[position : position + chunk]
+                hits.append(candidates[self._contains(bitset, candidates)])
+                found += len(hits[-1])
+                if found >= stop:
+                    break
+            return np.concatenate(hits)[start:stop]
+        # sparse matches: select the page by rank among the matches, O(matches)
+        rows = self.to_rows(bitset)
+        ranks = self.ranks[sortby][rows]
+        kth = np.unique([start, stop - 1])
+        in_page = np.argpartition(ranks, kth)[start:stop]
+        in_page = in_page[np.argsort(ranks[in_page])]
+        return rows[in_page]
+
+    def search(self, fields: List[Optional[List[str]]], sortby: str) -> SearchResult:
+        """Returns the matches of slot selections in sortby order."""
+        return SearchResult(self, self.match(list(fields)), sortby)
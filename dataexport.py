@@ -0,0 +1,214 @@
+"""Exports the summary db into a memory-mapped binary snapshot.
+
+The snapshot is a directory of fixed-dtype binary arrays plus a small JSON
+manifest. Workers open the arrays with numpy.memmap instead of parsing
+SQLite. The count cube the spec pages read is used as mapped, so every
+process on the host shares one page-cached copy of it; the tables are decoded
+from their arrays into private frames, which is still faster than SQLite.
+
+    Example use:
+
+    python dataexport.py data/summary.sqlite
+
+writes data/summary.snapshot/ next to the db file. With --indexes the script
+also adds the per-season/per-period indexes that DataServer's pushdown mode
+queries against.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import dataserver
+
+# db table -> name of the table in the snapshot (same as DataServer.raw_data keys)
+TABLES = {
+    "main_summary_seasons": "specs",
+    "weekly_summary": "weekly_top",
+    "composition": "composition",
+    "activity": "activity",
+}
+TABLE_ORDER = {"composition": "ORDER BY run_count DESC"}
+# indexes used by the WHERE season=? / WHERE period BETWEEN ? AND ? queries
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS main_summary_seasons_season "
+    "ON main_summary_seasons (season, spec, level)",
+    "CREATE INDEX IF NOT EXISTS weekly_summary_period ON weekly_summary (period)",
+]
+
+
+def _smallest_int_dtype(values: np.ndarray) -> np.dtype:
+    """Returns the smallest signed int dtype that holds all values."""
+    if len(values) == 0:
+        return np.dtype(np.int32)
+    low, high = values.min(), values.max()
+    for dtype in [np.int8, np.int16, np.int32, np.int64]:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _encode_column(column: pd.Series, dtype: Optional[np.dtype] = None) -> Dict:
+    """Converts a table column into a fixed-dtype array.
+
+    Numeric columns listed in dataserver.TABLE_DTYPES get that type, other
+    integers are narrowed and floats stored as float32. Strings are written
+    either as uint8 category codes (few distinct values, e.g. seasons) or as
+    fixed-width byte strings (e.g. comp tokens).
+
+    Returns
+    -------
+    encoded : dict
+        'values' is the array to write, 'categories' the decoding table for
+        categorical columns
+    """
+    if pd.api.types.is_numeric_dtype(column) and dtype is not None:
+        return {"values": column.to_numpy().astype(dtype)}
+    if pd.api.types.is_integer_dtype(column):
+        values = column.to_numpy()
+        return {"values": values.astype(_smallest_int_dtype(values))}
+    if pd.api.types.is_float_dtype(column):
+        return {"values": column.to_numpy(dtype=np.float32)}
+    strings = column.astype(str)
+    categories = pd.unique(strings)
+    if len(categories) <= 255 and len(categories) <= len(strings) // 2:
+        codes = pd.Categorical(strings, categories=categories).codes
+        return {"values": codes.astype(np.uint8), "categories": list(categories)}
+    width = max(1, int(strings.str.len().max())) if len(strings) else 1
+    return {"values": strings.to_numpy(dtype="S%d" % width)}
+
+
+def _write_array(out_dir: str, name: str, values: np.ndarray) -> Dict:
+    """Writes raw array bytes to out_dir/name.bin and returns its manifest entry."""
+    file_name = name + ".bin"
+    values = np.ascontiguousarray(values)
+    values.tofile(os.path.join(out_dir, file_name))
+    return {"file": file_name, "dtype": values.dtype.str, "shape": list(values.shape)}
+
+
+def export_binary_snapshot(db_file_path: str, out_dir: Optional[str] = None) -> str:
+    """Writes the summary tables and count cube as a binary snapshot.
+
+    The snapshot is assembled in a temp directory and then moved into place,
+    so a worker never opens a half-written snapshot.
+
+    Parameters
+    ----------
+    db_file_path : str
+        path to SQLite db file
+    out_dir : str, optional
+        snapshot directory; defaults to dataserver.snapshot_dir_for(db_file_path)
+
+    Returns
+    -------
+    out_dir : str
+        path of the written snapshot
+    """
+    out_dir = out_dir or dataserver.snapshot_dir_for(db_file_path)
+    tmp_dir = "%s.tmp-%d" % (out_dir, os.getpid())
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    manifest = {
+        "format": dataserver.SNAPSHOT_FORMAT,
+        "source_version": os.stat(db_file_path).st_mtime_ns,
+        "tables": {},
+        "arrays": {},
+    }
+
+    conn = sqlite3.connect(db_file_path)
+    existing = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    }
+    tables = {}
+    for db_table, name in TABLES.items():
+        if db_table not in existing:
+            continue
+        query = "SELECT * FROM %s %s" % (db_table, TABLE_ORDER.get(name, ""))
+        tables[name] = pd.read_sql_query(query, conn)
+    conn.close()
+
+    for name, table in tables.items():
+        columns = {}
+        for column_name in table.columns:
+            dtype = dataserver.TABLE_DTYPES.get(name, {}).get(column_name)
+            if dtype == "category":
+                dtype = None
+            encoded = _encode_column(table[column_name], dtype)
+            entry = _write_array(
+                tmp_dir, "%s.%s" % (name, column_name), encoded["values"]
+            )
+            if "categories" in encoded:
+                entry["categories"] = encoded["categories"]
+            columns[column_name] = entry
+        manifest["tables"][name] = {"rows": len(table), "columns": columns}
+
+    # the cube is what the spec callbacks read, so it is shared as-is
+    cube = dataserver.SpecLevelCube.from_frame(tables["specs"])
+    manifest["cube_seasons"] = cube.seasons
+    for name in ["spec_ids", "levels", "counts", "cumulative"]:
+        manifest["arrays"]["cube." + name] = _write_array(
+            tmp_dir, "cube." + name, getattr(cube, name)
+        )
+
+    manifest_path = os.path.join(tmp_dir, dataserver.SNAPSHOT_MANIFEST)
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+
+    old_dir = "%s.old-%d" % (out_dir, os.getpid())
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    # workers map all files of a snapshot when they load it, so workers still
+    # on the old snapshot keep reading the old (deleted) files until they reload
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return out_dir
+
+
+def create_indexes(db_file_path: str) -> None:
+    """Adds the indexes DataServer's pushdown mode relies on to the db.
+
+    Run this before export_binary_snapshot: it changes the db file, and a
+    snapshot is only used while it matches the db file it was made from.
+
+    Parameters
+    ----------
+    db_file_path : str
+        path to SQLite db file
+    """
+    conn = sqlite3.connect(db_file_path)
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+
+
+def main() -> None:
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("db_file_path", help="path to the summary SQLite db")
+    parser.add_argument("--out", default=None, help="snapshot directory")
+    parser.add_argument(
+        "--indexes", action="store_true", help="add pushdown-mode indexes to the db"
+    )
+    parser.add_argument(
+        "--skip-binary", action="store_true", help="do not write the binary snapshot"
+    )
+    args = parser.parse_args()
+    if args.indexes:
+        create_indexes(args.db_file_path)
+        print("Indexed %s" % args.db_file_path)
+    if not args.skip_binary:
+        out_dir = export_binary_snapshot(args.db_file_path, args.out)
+        print("Wrote binary snapshot to %s" % out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,769 @@
 """Container for methods that serve data to the apps."""
 
+import datetime
+import json
+import os
 import sqlite3
-from typing import Dict
+import threading
+import time
+import traceback
+import urllib.parse
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+import cache
+
+# binary snapshot layout, written by dataexport.py
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_MANIFEST = "manifest.json"
+
+# compact column types of the served tables; seasons are categorical
+TABLE_DTYPES = {
+    "specs": {
+        "season": "category",
+        "spec": np.int16,
+        "level": np.int16,
+        "run_count": np.int32,
+    },
+    "weekly_top": {"period": np.int16, "spec": np.int16, "run_count": np.int32},
+    "composition": {
+        "run_count": np.int32,
+        "level_mean": np.float32,
+        "level_std": np.float32,
+        "level_max": np.int16,
+    },
+    "activity": {"period": np.int16, "run_count": np.int32},
+}
+
+# "memory" loads all summary tables up front, "pushdown" queries per season;
+# pick per deployment with the METAWATCH_DATA_MODE environment variable
+DATA_MODES = ["memory", "pushdown"]
+
+# one shared server per db file per process, see get_dataserver()
+_registry: Dict[str, "DataServer"] = {}
+_registry_lock = threading.Lock()
+
+
+def get_dataserver(db_file_path: str) -> "DataServer":
+    """Returns the process-wide DataServer for the given db file.
+
+    The first call loads the tables, every later call (from any page module)
+    gets the same instance back. Treat the returned server as read-only.
+    The data mode is read from the METAWATCH_DATA_MODE environment variable
+    (see DATA_MODES; defaults to "memory"), the size cap of the shared disk
+    cache from METAWATCH_FIGURE_CACHE_MB (defaults to 0, no disk cache).
+
+    Parameters
+    ----------
+    db_file_path : str
+        path to SQLite db file
+
+    Returns
+    -------
+    dataserver : DataServer
+        shared data server for the db file
+    """
+    with _registry_lock:
+        dataserver = _registry.get(db_file_path)
+        if dataserver is None:
+            mode = os.environ.get("METAWATCH_DATA_MODE", "memory")
+            disk_cache_mb = float(os.environ.get("METAWATCH_FIGURE_CACHE_MB", 0))
+            dataserver = DataServer(
+                db_file_path, mode=mode, disk_cache_mb=disk_cache_mb
+            )
+            _registry[db_file_path] = dataserver
+            stats = dataserver.load_stats()
+            print(
+                "Loaded %s (%s mode) in %.2f s (%.1f MB)"
+                % (db_file_path, mode, stats["load_seconds"], stats["memory_mb"])
+            )
+    return dataserver
+
+
+def snapshot_dir_for(db_file_path: str) -> str:
+    """Returns the binary snapshot directory that belongs to the db file."""
+    return os.path.splitext(db_file_path)[0] + ".snapshot"
+
+
+def disk_cache_path_for(db_file_path: str) -> str:
+    """Returns the path of the shared disk cache that belongs to the db file."""
+    return os.path.splitext(db_file_path)[0] + ".cache.sqlite"
+
+
+def _read_manifest(snapshot_dir: str) -> Optional[Dict]:
+    """Returns the snapshot manifest, or None if there is no usable snapshot."""
+    try:
+        with open(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def _open_array(snapshot_dir: str, entry: Dict) -> np.ndarray:
+    """Maps an array of the binary snapshot read-only into memory."""
+    shape = tuple(entry["shape"])
+    if 0 in shape:  # np.memmap cannot map empty files
+        return np.zeros(shape, dtype=entry["dtype"])
+    return np.memmap(
+        os.path.join(snapshot_dir, entry["file"]),
+        dtype=np.dtype(entry["dtype"]),
+        mode="r",
+        shape=shape,
+    )
+
+
+def _open_arrays(snapshot_dir: str, manifest: Dict) -> Dict[str, np.ndarray]:
+    """Maps every array of the binary snapshot, tables and cube alike.
+
+    Mapping is cheap (nothing is read yet) and pins the files: a mapped file
+    stays readable after a new export replaces the directory, so tables that
+    are decoded later still come from the files the manifest describes.
+
+    Returns
+    -------
+    arrays : dict(str, np.ndarray)
+        'table.column' and 'cube.name' -> read-only array
+    """
+    arrays = {
+        "%s.%s" % (name, column_name): _open_array(snapshot_dir, entry)
+        for name, table in manifest["tables"].items()
+        for column_name, entry in table["columns"].items()
+    }
+    for name, entry in manifest["arrays"].items():
+        arrays[name] = _open_array(snapshot_dir, entry)
+    return arrays
+
+
+def _open_table(
+    manifest: Dict, arrays: Dict[str, np.ndarray], name: str
+) -> pd.DataFrame:
+    """Decodes a table of the binary snapshot into a dataframe.
+
+    The frame is a private copy of the mapped arrays: pandas consolidates
+    the columns into its own blocks, and categorical and byte-string columns
+    are decoded. Only arrays used as they are (the count cube) stay shared
+    between workers.
+    """
+    columns = {}
+    for column_name, entry in manifest["tables"][name]["columns"].items():
+        values = arrays["%s.%s" % (name, column_name)]
+        if "categories" in entry:
+            values = pd.Categorical.from_codes(values, categories=entry["categories"])
+        elif values.dtype.kind == "S":
+            values = values.astype(str).astype(object)
+        columns[column_name] = values
+    return pd.DataFrame(columns)
+
+
+def compact_dtypes(name: str, table: pd.DataFrame) -> pd.DataFrame:
+    """Casts table columns to the compact types listed in TABLE_DTYPES.
+
+    Parameters
+    ----------
+    name : str
+        table name, one of the TABLE_DTYPES keys
+    table : pd.DataFrame
+        table as read from the db
+
+    Returns
+    -------
+    table : pd.DataFrame
+        same table with narrowed columns; columns that are missing
+        from the schema are left as they are
+    """
+    dtypes = {
+        column: dtype
+        for column, dtype in TABLE_DTYPES.get(name, {}).items()
+        if column in table.columns and table[column].dtype != dtype
+    }
+    if not dtypes:
+        return table
+    return table.astype(dtypes)
+
+
+class SpecLevelCube:
+    """Dense run counts indexed by (season, spec, key level).
+
+    Built once from the long-format spec summary so that per-season lookups
+    are array slices instead of masked scans and pivots.
+    """
+
+    def __init__(
+        self,
+        seasons: List[str],
+        spec_ids: np.ndarray,
+        levels: np.ndarray,
+        counts: np.ndarray,
+        cumulative: Optional[np.ndarray] = None,
+    ) -> None:
+        """Inits with the cube axes and counts.
+
+        Parameters
+        ----------
+        seasons : List[str]
+            season ids along axis 0
+        spec_ids : np.ndarray
+            sorted spec ids along axis 1
+        levels : np.ndarray
+            consecutive key levels along axis 2
+        counts : np.ndarray
+            counts[season, spec, level] = number of runs
+        cumulative : np.ndarray, optional
+            prefix sums of counts along the level axis; computed if missing
+        """
+        # fixed index maps for the three axes
+        self.seasons = list(seasons)
+        self.season_index = {season: i for i, season in enumerate(self.seasons)}
+        self.spec_ids = spec_ids
+        self.spec_index = {int(spec): i for i, spec in enumerate(self.spec_ids)}
+        self.levels = levels
+        self.counts = counts
+
+        # running totals along the level axis; cumulative[..., k] holds runs at
+        # level positions < k, so any level cohort is a single subtraction
+        if cumulative is None:
+            cumulative = np.zeros(
+                counts.shape[:2] + (counts.shape[2] + 1,), dtype=np.int64
+            )
+            np.cumsum(counts, axis=2, out=cumulative[:, :, 1:])
+        self.cumulative = cumulative
+
+        # per-season spec presence and [first, last] populated level positions
+        self.spec_present = cumulative[:, :, -1] > 0
+        level_present = counts.sum(axis=1) > 0
+        self.level_bounds = np.zeros((len(self.seasons), 2), dtype=np.int64)
+        for season_pos_, levels_ in enumerate(level_present):
+            populated = np.flatnonzero(levels_)
+            if len(populated):
+                self.level_bounds[season_pos_] = populated[0], populated[-1]
+
+    @classmethod
+    def from_frame(cls, specs: pd.DataFrame) -> "SpecLevelCube":
+        """Builds the cube from the long-format spec summary.
+
+        Parameters
+        ----------
+        specs : pd.DataFrame
+            key count by spec/level/season (the main_summary_seasons table)
+
+        Returns
+        -------
+        cube : SpecLevelCube
+            dense counts for all seasons in the table
+        """
+        seasons = [str(season) for season in pd.unique(specs["season"])]
+        spec_ids = np.unique(specs["spec"].to_numpy()).astype(np.int64)
+        if len(specs):
+            min_level, max_level = int(specs["level"].min()), int(specs["level"].max())
+        else:
+            min_level, max_level = 2, 1
+        levels = np.arange(min_level, max_level + 1)
+
+        season_pos = pd.Categorical(specs["season"], categories=seasons).codes
+        spec_pos = np.searchsorted(spec_ids, specs["spec"].to_numpy())
+        level_pos = specs["level"].to_numpy().astype(np.int64) - min_level
+        counts = np.zeros((len(seasons), len(spec_ids), len(levels)), dtype=np.int64)
+        np.add.at(
+            counts,
+            (season_pos, spec_pos, level_pos),
+            specs["run_count"].to_numpy(),
+        )
+        return cls(seasons, spec_ids, levels, counts)
+
+    def season_slice(self, season: str) -> pd.DataFrame:
+        """Returns spec x level run counts for the season.
+
+        Parameters
+        ----------
+        season : str
+            season id, e.g. 'SL1'
+
+        Returns
+        -------
+        data : pd.DataFrame
+            run counts; index is spec id, columns are key levels
+        """
+        season_pos = self.season_index[season]
+        first, last = self.level_bounds[season_pos]
+        present = self.spec_present[season_pos]
+        data = pd.DataFrame(
+            self.counts[season_pos, present, first : last + 1],
+            index=pd.Index(self.spec_ids[present], name="spec"),
+            columns=pd.Index(self.levels[first : last + 1], name="level"),
+        )
+        return data
+
+    def season_cumulative(self, season: str) -> pd.DataFrame:
+        """Returns cumulative spec x level run counts for the season.
+
+        Parameters
+        ----------
+        season : str
+            season id, e.g. 'SL1'
+
+        Returns
+        -------
+        data : pd.DataFrame
+            index is spec id, columns are key levels starting one level below
+            the lowest populated level; cell [spec, level] is the number of
+            runs at or below that key level
+        """
+        season_pos = self.season_index[season]
+        first, last = self.level_bounds[season_pos]
+        present = self.spec_present[season_pos]
+        data = pd.DataFrame(
+            self.cumulative[season_pos, present, first : last + 2],
+            index=pd.Index(self.spec_ids[present], name="spec"),
+            columns=pd.Index(
+                np.arange(self.levels[first] - 1, self.levels[last] + 1), name="level"
+            ),
+        )
+        return data
+
+    def runs_per_level(self, season: str) -> np.ndarray:
+        """Returns spec records per key level, summed over specs."""
+        season_pos = self.season_index[season]
+        first, last = self.level_bounds[season_pos]
+        return self.counts[season_pos, :, first : last + 1].sum(axis=0)
+
+    def level_range(self, season: str) -> np.ndarray:
+        """Returns key levels populated in the season."""
+        first, last = self.level_bounds[self.season_index[season]]
+        return self.levels[first : last + 1]
+
+    def max_level(self, season: str) -> int:
+        """Returns max level of key completed in season."""
+        return int(self.levels[self.level_bounds[self.season_index[season], 1]])
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes held by the cube arrays."""
+        arrays = [self.counts, self.cumulative, self.spec_present, self.level_bounds]
+        return sum(array.nbytes for array in arrays)
+
+
+class DataSnapshot:
+    """One fully loaded version of the summary db.
+
+    Snapshots are built off to the side and never modified after that, so a
+    reader holding a reference always sees a complete, consistent data set.
+    The only additions are lazily loaded tables and derived objects, which
+    are computed once from the same data version and then kept.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        raw_data: Dict[str, pd.DataFrame],
+        load_seconds: float,
+        cube: Optional[SpecLevelCube] = None,
+        connection: Optional[sqlite3.Connection] = None,
+        manifest: Optional[Dict] = None,
+        arrays: Optional[Dict[str, np.ndarray]] = None,
+        cache_size: int = 32,
+    ) -> None:
+        """Inits with the loaded tables.
+
+        Parameters
+        ----------
+        version : int
+            modification time (ns) of the data files the snapshot was read from
+        raw_data : dict(str, pd.DataFrame)
+            tables returned by DataServer.load_raw_data
+        load_seconds : float
+            time it took to read the tables
+        cube : SpecLevelCube, optional
+            prebuilt count cube (from a binary snapshot); built from
+            raw_data["specs"] if missing, None if that table was not loaded
+        connection : sqlite3.Connection, optional
+            read-only connection the tables were read through; kept open
+            for the lazily loaded tables
+        manifest : dict, optional
+            manifest of the binary snapshot the tables were opened from
+        arrays : dict(str, np.ndarray), optional
+            mapped arrays of the binary snapshot the tables were opened
+            from, see _open_arrays; lazily loaded tables are decoded from
+            these, never from files opened later
+        cache_size : int
+            max number of query results kept by the snapshot (pushdown mode)
+        """
+        self.version = version
+        self.raw_data = raw_data
+        self.connection = connection
+        self.manifest = manifest
+        self.arrays = arrays
+        self._derived = {}
+        # one lock per table/derived key, so a slow build only holds up
+        # callers of the same key; _key_locks_lock guards the dict itself
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+        # the sqlite connection is used by one thread at a time
+        self._sql_lock = threading.Lock()
+        self.query_cache = cache.LRUCache(cache_size)
+        start = time.perf_counter()
+        if cube is None and "specs" in raw_data:
+            cube = SpecLevelCube.from_frame(raw_data["specs"])
+        self.cube = cube
+        self.load_seconds = load_seconds + time.perf_counter() - start
+
+    def table(
+        self, name: str, load: Callable[["DataSnapshot"], pd.DataFrame]
+    ) -> pd.DataFrame:
+        """Returns a table of the snapshot, loading it on first access.
+
+        Parameters
+        ----------
+        name : str
+            table name, key in raw_data
+        load : callable
+            called with the snapshot to read the table if it is not loaded yet
+
+        Returns
+        -------
+        table : pd.DataFrame
+            the table; shared by all callers, do not modify
+        """
+        table = self.raw_data.get(name)
+        if table is None:
+            with self._key_lock(("table", name)):
+                table = self.raw_data.get(name)
+                if table is None:
+                    table = load(self)
+                    self.raw_data[name] = table
+        return table
+
+    def derived(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Returns build() computed once for this snapshot.
+
+        Parameters
+        ----------
+        key : Hashable
+            name of the derived object
+        build : callable
+            computes the object; called at most once per snapshot
+
+        Returns
+        -------
+        value : Any
+            the derived object; shared by all callers, do not modify
+        """
+        if key not in self._derived:
+            with self._key_lock(("derived", key)):
+                if key not in self._derived:
+                    self._derived[key] = build()
+        return self._derived[key]
+
+    def _key_lock(self, key: Hashable) -> threading.Lock:
+        """Returns the lock that serializes loading/building of key."""
+        with self._key_locks_lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def read_sql(
+        self,
+        query: str,
+        params: Tuple = (),
+        connect: Optional[Callable[[], sqlite3.Connection]] = None,
+    ) -> pd.DataFrame:
+        """Runs a query through the snapshot's shared read-only connection.
+
+        Queries wait only for each other, never for table loads or builds.
+        connect opens the connection if the snapshot has none yet.
+        """
+        with self._sql_lock:
+            if self.connection is None and connect is not None:
+                self.connection = connect()
+            return pd.read_sql_query(query, self.connection, params=params)
+
+    def memory_report(self) -> Dict[str, int]:
+        """Returns number of bytes held by the snapshot, per table.
+
+        Memory-mapped arrays are counted in full, although their pages are
+        shared between all workers on the host.
+        """
+        report = {
+            name: int(table.memory_usage(deep=True).sum())
+            for name, table in list(self.raw_data.items())
+        }
+        report["cube"] = int(self.cube.nbytes) if self.cube is not None else 0
+        report["query_cache"] = sum(
+            (
+                value.nbytes
+                if isinstance(value, SpecLevelCube)
+                else int(value.memory_usage(deep=True).sum())
+            )
+            for value in self.query_cache.values()
+        )
+        return report
+
+    def memory_usage(self) -> int:
+        """Returns number of bytes held by the snapshot."""
+        return sum(self.memory_report().values())
+
 
 class DataServer:
     """Container for methods that serve data to the apps."""
 
-    def __init__(self, db_file_path: str) -> None:
+    def __init__(
+        self,
+        db_file_path: str,
+        reload_interval: float = 60.0,
+        immutable: bool = False,
+        mode: str = "memory",
+        cache_size: int = 32,
+        disk_cache_mb: float = 0,
+    ) -> None:
         """Inits with path to the SQLite db file.
 
         Parameters
         ----------
         db_file_path : str
             path to SQLite db file
+        reload_interval : float
+            min number of seconds between checks for a newer db file
+        immutable : bool
+            the db file is a static export that is only ever replaced
+            as a whole (never written in place); lets SQLite skip locking
+        mode : str
+            "memory" loads the summary tables into memory at start up;
+            "pushdown" loads nothing up front and runs season- and
+            period-scoped queries against the (indexed) db instead
+        cache_size : int
+            max number of per-season query results kept in pushdown mode
+        disk_cache_mb : float
+            size cap (MB) of the disk cache that worker processes share
+            for values built from the data (see shared()); 0 disables it
         """
+        if mode not in DATA_MODES:
+            raise ValueError("Data mode invalid. Must be one of: %s" % DATA_MODES)
         self.db_file_path = db_file_path
-        self.raw_data = self.load_raw_data()
+        self.snapshot_dir = snapshot_dir_for(db_file_path)
+        self.reload_interval = reload_interval
+        self.immutable = immutable
+        self.mode = mode
+        self.cache_size = cache_size
+        self.disk_cache = None
+        if disk_cache_mb > 0:
+            max_bytes = int(disk_cache_mb * 2**20)
+            self.disk_cache = cache.DiskCache(
+                disk_cache_path_for(db_file_path), max_bytes=max_bytes
+            )
+        self._snapshot = self._load_snapshot()
+        self._last_check = time.monotonic()
+        self._reload_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """Current data snapshot; may kick off a background reload.
+
+        Accessors grab this once per call and work off the returned object.
+        Callbacks that read the data more than once grab it themselves and
+        pass it to every accessor (the snapshot argument), so a swap in the
+        middle of a callback cannot mix two data versions.
+        """
+        self._check_for_update()
+        return self._snapshot
+
+    @property
+    def raw_data(self) -> Dict[str, pd.DataFrame]:
+        """Tables of the current snapshot."""
+        return self.snapshot.raw_data
+
+    @property
+    def cube(self) -> Optional[SpecLevelCube]:
+        """Spec/level count cube of the current snapshot (None in pushdown mode)."""
+        return self.snapshot.cube
+
+    @property
+    def version(self) -> int:
+        """Version of the data currently served (db file mtime in ns)."""
+        return self.snapshot.version
+
+    @property
+    def load_seconds(self) -> float:
+        """Time it took to load the current snapshot."""
+        return self._snapshot.load_seconds
+
+    def derived(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """Returns build() memoized for the data version currently served.
+
+        Use this for objects the apps compute from DataServer data (prepared
+        tables, indices, figures), so they are rebuilt after a reload.
+        """
+        return self.snapshot.derived(key, build)
+
+    def shared(
+        self,
+        key: str,
+        build: Callable[[], Any],
+        snapshot: Optional[DataSnapshot] = None,
+    ) -> Any:
+        """Returns build() through the disk cache shared by all workers.
+
+        Keyed by data version (of snapshot, if given), like derived().
+        build() must return a JSON-serializable value (e.g. a serialized
+        figure); without a disk cache it is simply called.
+        """
+        if self.disk_cache is None:
+            return build()
+        version = (self.snapshot if snapshot is None else snapshot).version
+        return self.disk_cache.get_or_compute(key, version, build)
+
+    def data_last_updated(self) -> str:
+        """Returns date (YYYY-MM-DD) of the db file currently served."""
+        timestamp = self.snapshot.version / 1e9
+        return datetime.datetime.fromtimestamp(int(timestamp)).strftime("%Y-%m-%d")
+
+    def memory_usage(self) -> int:
+        """Returns number of bytes held by the loaded tables."""
+        return self._snapshot.memory_usage()
+
+    def memory_report(self) -> Dict[str, int]:
+        """Returns number of bytes held by the loaded tables, per table."""
+        return self._snapshot.memory_report()
+
+    def load_stats(self) -> Dict[str, float]:
+        """Returns memory footprint (MB) and load time (s) of the server."""
+        return {
+            "memory_mb": self.memory_usage() / 2**20,
+            "load_seconds": self.load_seconds,
+        }
+
+    def cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """Returns stats of the snapshot's query cache and of the disk cache.
+
+        See cache.LRUCache.stats and cache.DiskCache.stats; counts are for
+        this process.
+        """
+        stats = {"query_cache": self.snapshot.query_cache.stats()}
+        if self.disk_cache is not None:
+            stats["disk_cache"] = self.disk_cache.stats()
+        return stats
 
-    def load_raw_data(self) -> Dict[str, pd.DataFrame]:
+    def _file_version(self) -> int:
+        """Returns latest modification time (ns) of the db file or its snapshot."""
+        version = os.stat(self.db_file_path).st_mtime_ns
+        manifest_path = os.path.join(self.snapshot_dir, SNAPSHOT_MANIFEST)
+        if os.path.exists(manifest_path):
+            version = max(version, os.stat(manifest_path).st_mtime_ns)
+        return version
+
+    def _load_snapshot(self) -> DataSnapshot:
+        """Reads the data files into a new snapshot.
+
+        Uses the binary snapshot when one was exported from the current db
+        file, and falls back to reading SQLite otherwise. In pushdown mode
+        only the connection is opened.
+        """
+        version = self._file_version()
+        start = time.perf_counter()
+        if self.mode == "pushdown":
+            return DataSnapshot(
+                version,
+                {},
+                time.perf_counter() - start,
+                connection=self._connect(),
+                cache_size=self.cache_size,
+            )
+        binary = self._open_binary_snapshot()
+        if binary is not None:
+            manifest, arrays = binary
+            raw_data, cube = self.load_binary_data(manifest, arrays)
+            return DataSnapshot(
+                version,
+                raw_data,
+                time.perf_counter() - start,
+                cube,
+                manifest=manifest,
+                arrays=arrays,
+            )
+        connection = self._connect()
+        raw_data = self.load_raw_data(connection)
+        return DataSnapshot(
+            version, raw_data, time.perf_counter() - start, connection=connection
+        )
+
+    def _open_binary_snapshot(self) -> Optional[Tuple[Dict, Dict[str, np.ndarray]]]:
+        """Maps the binary snapshot if it was exported from the current db file.
+
+        Returns
+        -------
+        binary : tuple or None
+            (manifest, arrays) of the snapshot, see _open_arrays; None if
+            there is no usable snapshot, or if a new export replaced it while
+            it was being opened (the next update check picks that one up)
+        """
+        try:
+            directory = os.stat(self.snapshot_dir).st_ino
+            manifest = _read_manifest(self.snapshot_dir)
+            db_version = os.stat(self.db_file_path).st_mtime_ns
+            if manifest is None or manifest["source_version"] != db_version:
+                return None
+            arrays = _open_arrays(self.snapshot_dir, manifest)
+            # exports move a new directory into place; if that happened since
+            # the manifest was read, the arrays may not match it
+            if os.stat(self.snapshot_dir).st_ino != directory:
+                return None
+        except (OSError, ValueError):
+            return None
+        return manifest, arrays
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens a read-only connection to the db file.
+
+        The connection is shared by all threads of the worker; DataSnapshot
+        serializes access to it.
+        """
+        uri = "file:%s?mode=ro" % urllib.parse.quote(os.path.abspath(self.db_file_path))
+        if self.immutable:
+            uri += "&immutable=1"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def _check_for_update(self) -> None:
+        """Starts a background reload if the db file changed on disk."""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return
+        self._last_check = now
+        try:
+            version = self._file_version()
+        except OSError:
+            return  # file is being replaced; try again on the next check
+        if version == self._snapshot.version:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return  # a reload is already running
+        thread = threading.Thread(target=self._reload, daemon=True)
+        thread.start()
+
+    def _reload(self) -> None:
+        """Loads the new db file and swaps it in as the current snapshot."""
+        try:
+            snapshot = self._load_snapshot()
+            # discard the load if the file was replaced again while reading it
+            if snapshot.version == self._file_version():
+                self._snapshot = snapshot  # reference swap is atomic
+                print(
+                    "Reloaded %s in %.2f s" % (self.db_file_path, snapshot.load_seconds)
+                )
+        except Exception:
+            # keep serving the old snapshot, the next check will retry
+            traceback.print_exc()
+        finally:
+            self._reload_lock.release()
+
+    def load_raw_data(self, conn: sqlite3.Connection) -> Dict[str, pd.DataFrame]:
         """Loads data tables from the SQLite file.
 
+        Parameters
+        ----------
+        conn : sqlite3.Connection
+            connection to the db file
+
         Returns
         -------
         raw_data : dict(str, pd.DataFrame)
@@ -30,14 +771,88 @@ class DataServer:
             raw_data["specs"] is key count by spec/level/season
             raw_data["weekly"] is key count by spec/week(period) inside the top 500 keys
         """
-        conn = sqlite3.connect(self.db_file_path)
         specs = pd.read_sql_query("SELECT * FROM main_summary_seasons", conn)
         weekly = pd.read_sql_query("SELECT * FROM weekly_summary", conn)
-        raw_data = {"specs": specs, "weekly_top": weekly}
-        conn.close()
+        raw_data = {
+            "specs": compact_dtypes("specs", specs),
+            "weekly_top": compact_dtypes("weekly_top", weekly),
+        }
         return raw_data
 
-    def get_data_for_ridgeplot(self, season: str) -> pd.DataFrame:
+    def load_binary_data(
+        self, manifest: Dict, arrays: Dict[str, np.ndarray]
+    ) -> Tuple[Dict[str, pd.DataFrame], SpecLevelCube]:
+        """Opens the count cube and tables of the memory-mapped binary snapshot.
+
+        The cube works on the mapped arrays directly, so its pages are shared
+        by all workers on the host. The spec table is not loaded: the cube
+        is built from it and is all the accessors read. The weekly table is
+        decoded into a (small) private frame.
+
+        Parameters
+        ----------
+        manifest : dict
+            manifest of the snapshot
+        arrays : dict(str, np.ndarray)
+            mapped arrays of the snapshot, see _open_arrays
+
+        Returns
+        -------
+        raw_data : dict(str, pd.DataFrame)
+            the tables of load_raw_data other than the spec table
+        cube : SpecLevelCube
+            count cube backed by the memory-mapped arrays
+        """
+        raw_data = {
+            "weekly_top": compact_dtypes(
+                "weekly_top", _open_table(manifest, arrays, "weekly_top")
+            )
+        }
+        cube = SpecLevelCube(
+            seasons=manifest["cube_seasons"],
+            **{
+                name: arrays["cube." + name]
+                for name in ["spec_ids", "levels", "counts", "cumulative"]
+            },
+        )
+        return raw_data, cube
+
+    def get_seasons(self, snapshot: Optional[DataSnapshot] = None) -> List[str]:
+        """Returns ids of the seasons in the data."""
+        snapshot = self.snapshot if snapshot is None else snapshot
+        if snapshot.cube is not None:
+            return list(snapshot.cube.seasons)
+        seasons = snapshot.query_cache.get_or_compute(
+            ("seasons",),
+            lambda: snapshot.read_sql(
+                "SELECT DISTINCT season FROM main_summary_seasons"
+            ),
+        )
+        return list(seasons["season"])
+
+    def _season_cube(self, snapshot: DataSnapshot, season: str) -> SpecLevelCube:
+        """Returns a count cube that covers the season.
+
+        In memory mode this is the snapshot's full cube. In pushdown mode it
+        is a one-season cube built from a WHERE season=? query and kept in
+        the snapshot's LRU.
+        """
+        if snapshot.cube is not None:
+            return snapshot.cube
+
+        def query_season() -> SpecLevelCube:
+            specs = snapshot.read_sql(
+                "SELECT season, spec, level, run_count FROM main_summary_seasons "
+                "WHERE season = ?",
+                (season,),
+            )
+            return SpecLevelCube.from_frame(compact_dtypes("specs", specs))
+
+        return snapshot.query_cache.get_or_compute(("season", season), query_season)
+
+    def get_data_for_ridgeplot(
+        self, season: str, snapshot: Optional[DataSnapshot] = None
+    ) -> pd.DataFrame:
         """Returns key counts for ridge plot.
 
         Returns
@@ -45,19 +860,12 @@ class DataServer:
         data : pd.DataFrame
             pivoted run counts; index is spec id, columns are key levels,
         """
-        data = self.raw_data["specs"]
-        season_mask = data["season"] == season
-        # pivot tables for the figure api
-        data = pd.pivot_table(
-            data[season_mask],
-            values="run_count",
-            index=["spec"],
-            columns=["level"],
-            fill_value=0,
-        )
-        return data
+        snapshot = self.snapshot if snapshot is None else snapshot
+        return self._season_cube(snapshot, season).season_slice(season)
 
-    def get_data_for_run_histogram(self, season: str) -> pd.DataFrame:
+    def get_data_for_run_histogram(
+        self, season: str, snapshot: Optional[DataSnapshot] = None
+    ) -> pd.DataFrame:
         """Returns key counts vs level for histogram on panel 3.
 
         Returns
@@ -65,20 +873,71 @@ class DataServer:
         run_per_level : pd.DataFrame
             index is key level, column is run count
         """
-        data = self.raw_data["specs"]
-        run_per_level = (
-            data.loc[data["season"] == season, ["level", "run_count"]]
-            .groupby("level")
-            .sum()
+        snapshot = self.snapshot if snapshot is None else snapshot
+        cube = self._season_cube(snapshot, season)
+        runs = np.round(cube.runs_per_level(season) / 5)  # 5 records per run
+        run_per_level = pd.DataFrame(
+            {"run_count": runs.astype(int)},
+            index=pd.Index(cube.level_range(season), name="level"),
         )
-        run_per_level = round(run_per_level / 5)  # there are 5 records per run
-        run_per_level = run_per_level.astype(int)
         return run_per_level
 
-    def get_data_for_weekly_chart(self) -> pd.DataFrame:
-        """Returns top 500 key counts resolved by week and spec."""
+    def get_data_for_meta_index(
+        self, season: str, snapshot: Optional[DataSnapshot] = None
+    ) -> pd.DataFrame:
+        """Returns cumulative key counts for the tier list.
+
+        Returns
+        -------
+        data : pd.DataFrame
+            index is spec id, columns are key levels; cell is the number of
+            runs at or below the key level (see SpecLevelCube.season_cumulative)
+        """
+        snapshot = self.snapshot if snapshot is None else snapshot
+        return self._season_cube(snapshot, season).season_cumulative(season)
+
+    def get_data_for_weekly_chart(
+        self,
+        period_start: Optional[int] = None,
+        period_end: Optional[int] = None,
+        snapshot: Optional[DataSnapshot] = None,
+    ) -> pd.DataFrame:
+        """Returns top 500 key counts resolved by week and spec.
+
+        Parameters
+        ----------
+        period_start : int, optional
+            first period (week) to include; defaults to the first on record
+        period_end : int, optional
+            last period (week) to include; defaults to the last on record
+        snapshot : DataSnapshot, optional
+            snapshot to read from; defaults to the current one
+
+        Returns
+        -------
+        data : pd.DataFrame
+            run counts; index is spec id, columns are periods
+        """
+        snapshot = self.snapshot if snapshot is None else snapshot
+        low = period_start if period_start is not None else -(2**31)
+        high = period_end if period_end is not None else 2**31 - 1
+        if "weekly_top" in snapshot.raw_data:
+            weekly = snapshot.raw_data["weekly_top"]
+            if period_start is not None or period_end is not None:
+                weekly = weekly[weekly["period"].between(low, high)]
+        else:
+            weekly = snapshot.query_cache.get_or_compute(
+                ("weekly", low, high),
+                lambda: compact_dtypes(
+                    "weekly_top",
+                    snapshot.read_sql(
+                        "SELECT * FROM weekly_summary WHERE period BETWEEN ? AND ?",
+                        (low, high),
+                    ),
+                ),
+            )
         data = pd.pivot_table(
-            self.raw_data["weekly_top"],
+            weekly,
             values="run_count",
             index="spec",
             columns="period",
@@ -86,88 +945,107 @@ class DataServer:
         )
         return data
 
-    def get_max_key_for_season(self, season) -> int:
+    def get_max_key_for_season(
+        self, season, snapshot: Optional[DataSnapshot] = None
+    ) -> int:
         """Returns max level of key completed in season."""
-        data = self.raw_data["specs"]
-        max_key_level = data.loc[data["season"] == season, "level"].max()
-        return max_key_level
+        snapshot = self.snapshot if snapshot is None else snapshot
+        return self._season_cube(snapshot, season).max_level(season)
 
-    def get_comp_data(self) -> pd.DataFrame:
-        """Fetches composition table from the db.
+    def _load_lazy_table(
+        self, snapshot: DataSnapshot, name: str, query: str
+    ) -> pd.DataFrame:
+        """Reads a table of the snapshot from the binary snapshot or the db."""
+        if snapshot.manifest is not None and name in snapshot.manifest["tables"]:
+            table = _open_table(snapshot.manifest, snapshot.arrays, name)
+        else:
+            table = snapshot.read_sql(query, connect=self._connect)
+        return compact_dtypes(name, table)
+
+    def get_comp_data(self, snapshot: Optional[DataSnapshot] = None) -> pd.DataFrame:
+        """Returns composition table; loaded once per data version.
 
         Returns
         -------
         composition : pd.DataFrame
             dataframe with following columns - tokenized comp name,
             number of runs by comp, average and std dev of the run
-            key levels
+            key levels; shared, do not modify
         """
-        conn = sqlite3.connect(self.db_file_path)
-        composition = pd.read_sql_query(
-            "SELECT * FROM composition ORDER BY run_count DESC", conn
+        snapshot = self.snapshot if snapshot is None else snapshot
+        return snapshot.table(
+            "composition",
+            lambda snapshot: self._load_lazy_table(
+                snapshot,
+                "composition",
+                "SELECT * FROM composition ORDER BY run_count DESC",
+            ),
         )
-        conn.close()
-        return composition
 
-    def get_activity_data(self) -> pd.DataFrame:
-        """Fetches activity table from the db.
+    def get_activity_data(
+        self, snapshot: Optional[DataSnapshot] = None
+    ) -> pd.DataFrame:
+        """Returns activity table; loaded once per data version.
 
         Returns
         -------
         activity : pd.DataFrame
-            dataframe with periods and their run counts
+            dataframe with periods and their run counts; shared, do not modify
         """
-        conn = sqlite3.connect(self.db_file_path)
-        activity = pd.read_sql_query("SELECT * FROM activity", conn)
-        conn.close()
+        snapshot = self.snapshot if snapshot is None else snapshot
+        return snapshot.table("activity", self._load_activity)
+
+    def _load_activity(self, snapshot: DataSnapshot) -> pd.DataFrame:
+        """Reads activity table and patches in the missing early periods."""
+        activity = self._load_lazy_table(snapshot, "activity", "SELECT * FROM activity")
         # this is a lazy fix.... add some of the missing data:
         # I need to fix this later.
         old_data = {
-            734:552152,
-            735:573429,
-            736:600545,
-            737:533797,
-            738:600092,
-            739:574013,
-            740:632797,
-            741:566984,
-            742:530253,
-            743:602726,
-            744:619092,
-            745:675847,
-            746:664888,
-            747:687195,
-            748:715860,
-            749:621633,
-            750:734762,
-            751:750325,
-            752:718098,
-            753:695534,
-            754:693893,
-            755:629968,
-            756:607517,
-            757:627584,
-            758:601825,
-            759:551282,
-            760:606719,
-            761:565799,
-            762:604201,
-            763:496264,
-            764:552763,
-            765:473691,
-            766:403492,
-            767:371905,
-            768:367528,
-            769:349379,
-            770:285902,
-            771:267267,
-            772:353923
+            734: 552152,
+            735: 573429,
+            736: 600545,
+            737: 533797,
+            738: 600092,
+            739: 574013,
+            740: 632797,
+            741: 566984,
+            742: 530253,
+            743: 602726,
+            744: 619092,
+            745: 675847,
+            746: 664888,
+            747: 687195,
+            748: 715860,
+            749: 621633,
+            750: 734762,
+            751: 750325,
+            752: 718098,
+            753: 695534,
+            754: 693893,
+            755: 629968,
+            756: 607517,
+            757: 627584,
+            758: 601825,
+            759: 551282,
+            760: 606719,
+            761: 565799,
+            762: 604201,
+            763: 496264,
+            764: 552763,
+            765: 473691,
+            766: 403492,
+            767: 371905,
+            768: 367528,
+            769: 349379,
+            770: 285902,
+            771: 267267,
+            772: 353923,
         }
         old_data = {
             "period": list(old_data.keys()),
-            "run_count": list(old_data.values())
+            "run_count": list(old_data.values()),
         }
-        old_data = pd.DataFrame(old_data)
+        old_data = compact_dtypes("activity", pd.DataFrame(old_data))
         activity = pd.concat([activity, old_data], axis=0)
         activity.sort_values(by="period", ascending=True, inplace=True)
         return activity
@@ -12,13 +12,268 @@ Data is a pandas df formatted as:
     cells are number of runs at [key level] for [spec]
 """
 
+import base64
+import functools
 import importlib
-from typing import List, Tuple, Type
+import json
+import os
+from typing import Any, List, Tuple, Type
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.utils
 
 import blizzcolors
+import cache
+
+# graph objects validate every property, which is handy while developing but
+# dominates callback time; by default figures are built as plain dicts.
+# Set METAWATCH_VALIDATE_FIGURES=1 to build validated go.Figure objects again.
+VALIDATE_FIGURES = os.environ.get("METAWATCH_VALIDATE_FIGURES", "0") == "1"
+
+# lean figures can carry numeric arrays in plotly's base64 typed-array format
+# ({"dtype": "i2", "bdata": ...}) instead of JSON number lists; it is several
+# times smaller and faster to parse, but needs plotly.js 2.28+ in the browser
+# (dash 1.17 bundles plotly.js 1.x), so it is off unless
+# METAWATCH_TYPED_ARRAYS=1. The client-side stores decode it on their own.
+TYPED_ARRAYS = os.environ.get("METAWATCH_TYPED_ARRAYS", "0") == "1"
+# shorter arrays are cheaper as plain JSON
+TYPED_ARRAY_MIN_SIZE = 8
+
+# key level charts draw one bin per level up to KEY_LEVEL_MAX_BINS levels,
+# which covers the seasons on record; above that, sparse high levels (each
+# under KEY_LEVEL_MIN_SHARE of all runs) are merged into buckets, so the
+# number of bins stays bounded as keys rise
+KEY_LEVEL_MAX_BINS = 40
+KEY_LEVEL_MIN_SHARE = 0.005
+
+
+def serialize(fig: go.Figure) -> dict:
+    """Converts a figure into a plain, JSON-ready dict.
+
+    The result can be cached and returned from callbacks as is; Dash only
+    has to dump it, without plotly validating or rebuilding the figure.
+    """
+    return json.loads(fig.to_json())
+
+
+def _plain(value: Any) -> Any:
+    """Converts numpy/pandas values into JSON-ready python objects."""
+    if isinstance(value, dict):
+        return _expand(value)
+    if isinstance(value, (list, tuple)):
+        return [
+            item if isinstance(item, (str, int, float, type(None))) else _plain(item)
+            for item in value
+        ]
+    if isinstance(value, (np.ndarray, pd.Series, pd.DataFrame, pd.Index)):
+        values = np.asarray(value)
+        if _encodes_as_typed_array(values):
+            return _typed_array(values)
+        if values.dtype.kind == "f" and np.isnan(values).any():
+            values = np.where(np.isnan(values), None, values)
+        return values.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _encodes_as_typed_array(values: np.ndarray) -> bool:
+    """Checks if _plain should emit values as a typed array."""
+    if not TYPED_ARRAYS or values.size < TYPED_ARRAY_MIN_SIZE:
+        return False
+    if values.dtype.kind == "f":
+        return not np.isnan(values).any()  # JSON null has no typed equivalent
+    return values.dtype.kind in "iu"
+
+
+def _typed_array(values: np.ndarray) -> dict:
+    """Encodes numeric array in plotly's typed-array (base64) format.
+
+    Integers are stored in the smallest int type that holds them, floats
+    as float32 (plenty for drawing).
+    """
+    dtype = np.float32
+    if values.dtype.kind in "iu":
+        dtype = np.float64  # plotly has no 64-bit int arrays
+        for int_dtype in [np.int8, np.int16, np.int32]:
+            info = np.iinfo(int_dtype)
+            if info.min <= values.min() and values.max() <= info.max:
+                dtype = int_dtype
+                break
+    values = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    encoded = dict(
+        dtype=values.dtype.str[1:],
+        bdata=base64.b64encode(values.tobytes()).decode("ascii"),
+    )
+    if values.ndim > 1:
+        encoded["shape"] = ", ".join(str(size) for size in values.shape)
+    return encoded
+
+
+def _merge(target: dict, update: dict) -> dict:
+    """Merges update into a copy of target like go.Figure.update_layout does."""
+    merged = dict(target)
+    for name, value in update.items():
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            value = _merge(merged[name], value)
+        merged[name] = value
+    return merged
+
+
+def _expand(properties: dict) -> dict:
+    """Expands plotly's magic underscores (marker_color=...) into nested dicts."""
+    expanded = {}
+    for name, value in properties.items():
+        path = name.split("_")
+        target = expanded
+        for part in path[:-1]:
+            target = target.setdefault(part, {})
+        value = _plain(value)
+        leaf = path[-1]
+        if leaf == "title" and isinstance(value, str):
+            value = dict(text=value)  # what go.Figure turns a plain title into
+        if isinstance(value, dict) and isinstance(target.get(leaf), dict):
+            value = _merge(target[leaf], value)
+        target[leaf] = value
+    return expanded
+
+
+@functools.lru_cache(maxsize=None)
+def _default_template() -> dict:
+    """Returns the plotly template go.Figure applies, as a plain dict."""
+    return json.loads(go.Figure().to_json())["layout"]["template"]
+
+
+class LeanFigure(dict):
+    """Figure built as a plain dict, without graph object validation.
+
+    Supports the part of the go.Figure interface used in this module, so
+    the figure classes can build either kind. Dash sends it to the browser
+    as is.
+    """
+
+    def __init__(self, data=None, layout=None) -> None:
+        super().__init__(data=[], layout=dict(template=_default_template()))
+        if data is not None:
+            self.add_traces(data)
+        if layout is not None:
+            self.update_layout(layout)
+
+    def add_trace(self, trace: dict) -> "LeanFigure":
+        """Appends a trace."""
+        self["data"].append(trace)
+        return self
+
+    def add_traces(self, traces) -> "LeanFigure":
+        """Appends a trace or a list of traces."""
+        if isinstance(traces, dict):
+            traces = [traces]
+        self["data"].extend(traces)
+        return self
+
+    def update_layout(self, dict1: dict = None, **kwargs) -> "LeanFigure":
+        """Merges layout properties into the layout."""
+        update = _expand(dict(dict1 or {}, **kwargs))
+        self["layout"] = _merge(self["layout"], update)
+        return self
+
+    def add_annotation(self, annotation: dict = None, **kwargs) -> "LeanFigure":
+        """Appends an annotation to the layout."""
+        annotations = list(self["layout"].get("annotations", []))
+        annotations.append(_expand(dict(annotation or {}, **kwargs)))
+        self["layout"] = dict(self["layout"], annotations=annotations)
+        return self
+
+    def to_plotly_json(self) -> dict:
+        """Returns the figure dict (same hook Dash uses for go.Figure)."""
+        return dict(self)
+
+    def to_json(self) -> str:
+        """Dumps the figure to a JSON string."""
+        return json.dumps(self, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def make_figure(data=None, layout=None):
+    """Creates an empty figure, validated or lean (see VALIDATE_FIGURES)."""
+    if VALIDATE_FIGURES:
+        return go.Figure(data=data, layout=layout)
+    return LeanFigure(data=data, layout=layout)
+
+
+def scatter(**properties):
+    """Creates a scatter trace, validated or lean (see VALIDATE_FIGURES)."""
+    if VALIDATE_FIGURES:
+        return go.Scatter(**properties)
+    return dict(type="scatter", **_expand(properties))
+
+
+def bar(**properties):
+    """Creates a bar trace, validated or lean (see VALIDATE_FIGURES)."""
+    if VALIDATE_FIGURES:
+        return go.Bar(**properties)
+    return dict(type="bar", **_expand(properties))
+
+
+def bin_key_levels(
+    data: pd.DataFrame,
+    max_bins: int = KEY_LEVEL_MAX_BINS,
+    min_share: float = KEY_LEVEL_MIN_SHARE,
+) -> Tuple[pd.DataFrame, Any]:
+    """Merges sparse high key levels into coarser buckets.
+
+    Levels are kept exact up to max_bins levels. Otherwise, starting with
+    the first level past the busiest one that has less than min_share of all
+    runs, the remaining levels are merged into buckets of at least min_share
+    of all runs each, with no more buckets than max_bins has room for after
+    the exact levels.
+
+    Parameters
+    ----------
+    data : DataFrame
+        runs per spec (rows) and key level (columns); columns must be
+        consecutive key levels
+    max_bins : int
+        largest number of levels drawn exactly
+    min_share : float
+        share of all runs below which a high key level counts as sparse
+
+    Returns
+    -------
+    binned : DataFrame
+        runs per spec (rows) and bucket (columns, lowest key level of the
+        bucket); data itself in the exact mode
+    bins : tuple of arrays or None
+        (lower, upper) key levels of each bucket; None in the exact mode
+    """
+    levels = data.columns.to_numpy()
+    if len(levels) <= max_bins:
+        return data, None
+    runs = data.to_numpy()
+    level_runs = runs.sum(axis=0)
+    total_runs = level_runs.sum()
+    peak = int(np.argmax(level_runs))
+    sparse = np.flatnonzero(level_runs[peak:] < min_share * total_runs)
+    if len(sparse) == 0:
+        return data, None
+    tail_start = peak + int(sparse[0])
+    tail_runs = level_runs[tail_start:]
+    budget = max(max_bins - tail_start, 1)
+    bucket_runs = max(min_share * total_runs, tail_runs.sum() / budget, 1)
+    # a tail level joins bucket k when the runs before it in the tail are
+    # within [k, k + 1) * bucket_runs
+    tail_bucket = (np.cumsum(tail_runs) - tail_runs) // bucket_runs
+    bucket = np.concatenate([np.arange(tail_start), tail_start + tail_bucket])
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    if len(starts) == len(levels):
+        return data, None
+    lower = levels[starts]
+    upper = levels[np.r_[starts[1:], len(levels)] - 1]
+    binned = pd.DataFrame(
+        np.add.reduceat(runs, starts, axis=1), index=data.index, columns=lower
+    )
+    return binned, (lower, upper)
 
 
 class RidgePlot:
@@ -34,6 +289,8 @@ class RidgePlot:
         """
         self.patch = patch
         self.data = data  # the table should already be pivoted
+        # ridges may merge sparse high key levels; best keys stay exact
+        self.binned, self.bins = bin_key_levels(data)
         self.summary = self._get_summary_table(data)
         sorted_summary = self._sort_summary(sort_by="best_key")
 
@@ -44,20 +301,19 @@ class RidgePlot:
 
     def _get_summary_table(self, data):
         """Computes total population and best key for each spec."""
+        runs = data.to_numpy()
         summary = pd.DataFrame(data.index)
-        summary["total_run"] = data.sum(axis=1).values
-        summary["best_key"] = data.apply(
-            lambda x: self._find_highest_key(x), axis=1
-        ).values
+        summary["total_run"] = runs.sum(axis=1)
+        summary["best_key"] = self._find_highest_keys(runs)
         return summary
 
     @staticmethod
-    def _find_highest_key(row):
-        """Finds index of the last non-zero int in list."""
-        highest_key_index = None
-        for bin_, num_keys_in_bin in enumerate(row):
-            if num_keys_in_bin != 0:
-                highest_key_index = bin_
+    def _find_highest_keys(runs):
+        """Finds key level of the last non-zero bin in each row."""
+        has_runs = runs != 0
+        # position of the last non-zero bin = width - 1 - first hit from the right
+        highest_key_index = runs.shape[1] - 1 - np.argmax(has_runs[:, ::-1], axis=1)
+        highest_key_index[~has_runs.any(axis=1)] = 0
         highest_key_level = highest_key_index + 2  # key level starts with 2
         return highest_key_level
 
@@ -79,42 +335,79 @@ class RidgePlot:
     def _calculate_vertical_offset(self):
         """Calculates size of vertical gap between traces."""
         # let's make the gap be as wide as median # of keys at +15 level
-        gap = self.data.max(axis=1).median()
+        gap = np.median(self._get_ridge_heights().max(axis=1))
         return gap
 
+    def _get_ridge_heights(self):
+        """Returns runs per key level of each spec, averaged within buckets."""
+        runs = self.binned.to_numpy()
+        if self.bins is None:
+            return runs
+        lower, upper = self.bins
+        return runs / (upper - lower + 1)
+
+    def _key_level_x(self, key_level):
+        """Returns x of a key level, at most the x of the last ridge point."""
+        if self.bins is None:
+            return key_level - 2
+        lower, upper = self.bins
+        return min(key_level - 2, (lower[-1] + upper[-1]) / 2 - 2)
+
+    def _get_baselines(self, sorted_summary):
+        """Computes y of each spec's horizontal baseline, top spec first."""
+        num_specs = len(self.summary)
+        vertical_offset = self._calculate_vertical_offset()
+        return vertical_offset * (num_specs - np.arange(len(sorted_summary)))
+
     def _construct_traces(self, sorted_summary):
         """Makes line/fill traces of the data distribution."""
-        key_levels = list(self.data)
-        key_levels_x = [i - 2 for i in list(key_levels)]  # x is 0, key is 2
-        vertical_offset = self._calculate_vertical_offset()
-        num_specs = len(self.summary)
-        specs = blizzcolors.Specs()
+        spec_order = sorted_summary.iloc[:, 0].to_numpy()
+        baselines = self._get_baselines(sorted_summary)
+        # all ridges in one pass: runs of each spec lifted onto its baseline
+        spec_rows = self.binned.index.get_indexer(spec_order)
+        runs = self.binned.to_numpy()[spec_rows]
+        ridges_y = self._get_ridge_heights()[spec_rows] + baselines[:, np.newaxis]
+        if self.bins is None:
+            key_levels_x = self.binned.columns.to_numpy() - 2  # x is 0, key is 2
+            customdata = np.empty(runs.shape + (2,), dtype=np.int64)
+            customdata[:, :, 0] = key_levels_x + 2
+            customdata[:, :, 1] = runs
+            hovertemplate = "KEY LEVEL: +%{customdata[0]}<br>RUNS: %{customdata[1]:,}"
+        else:
+            # a bucket is drawn at its middle, at its mean runs per key level
+            lower, upper = self.bins
+            key_levels_x = (lower + upper) / 2 - 2
+            customdata = np.empty(runs.shape + (3,), dtype=np.int64)
+            customdata[:, :, 0] = lower
+            customdata[:, :, 1] = upper
+            customdata[:, :, 2] = runs
+            hovertemplate = (
+                "KEY LEVEL: +%{customdata[0]} TO +%{customdata[1]}"
+                "<br>RUNS: %{customdata[2]:,}"
+            )
+        specs = {spec["spec_id"]: spec for spec in blizzcolors.Specs().specs}
         traces = {}
-        for index, row in enumerate(list(sorted_summary.values)):
-            spec_id = row[0]
-            spec_color = "rgba(%d,%d,%d,0.9)" % specs.get_color(spec_id)
-            runs = self.data.loc[self.data.index == spec_id].values[0]
+        for index, spec_id in enumerate(spec_order):
+            spec = specs[spec_id]
             # horizontal baseline for each ridge distribution
-            baseline_y = vertical_offset * (num_specs - index)
-            baseline = go.Scatter(
+            baseline = scatter(
                 x=key_levels_x,
-                y=[baseline_y] * len(key_levels_x),
+                y=np.full(len(key_levels_x), baselines[index]),
                 line=dict(width=0.5, color="black"),
                 hoverinfo="skip",
                 mode="lines",
             )
             # the distribution of runs vs key level (the star of the show)
-            ridge = go.Scatter(
+            ridge = scatter(
                 x=key_levels_x,
-                y=[baseline_y + run for run in runs],
+                y=ridges_y[index],
                 fill="tozerox",
-                fillcolor=spec_color,
+                fillcolor="rgba(%d,%d,%d,0.9)" % spec["color"],
                 mode="lines",
                 line=dict(width=1, color="black", shape="spline"),
-                name=specs.get_spec_name(spec_id).upper(),
-                text=[f"{y:,}" for y in runs],
-                customdata=[i + 2 for i in key_levels_x],
-                hovertemplate="KEY LEVEL: +%{customdata}<br>RUNS: %{text}",
+                name=spec["spec_name"].upper(),
+                customdata=customdata[index],
+                hovertemplate=hovertemplate,
             )
             traces[spec_id] = {"ridge": ridge, "baseline": baseline}
         return traces
@@ -147,11 +440,11 @@ class RidgePlot:
             # reassign color based on spec role
             new_ridge_color = None
             if spec_role == keep_role:
-                new_ridge_color = spec_traces["ridge"].fillcolor
+                new_ridge_color = spec_traces["ridge"]["fillcolor"]
             else:
                 new_ridge_color = custom_gray
             # keep baseline the original color
-            baseline_color = spec_traces["baseline"].line.color
+            baseline_color = spec_traces["baseline"]["line"]["color"]
             recolor.append(new_ridge_color)
             recolor.append(baseline_color)
         return recolor
@@ -181,13 +474,10 @@ class RidgePlot:
     def _make_spec_name_annos(self, sorted_summary):
         """Make spec name annotations."""
         annotations = {}
-        vertical_offset = self._calculate_vertical_offset()
-        num_specs = len(sorted_summary)
-        specs = blizzcolors.Specs()
-        for index, row in enumerate(list(sorted_summary.values)):
-            spec_id = row[0]
-            spec_name = specs.get_spec_name(spec_id).upper()
-            baseline_y = vertical_offset * (num_specs - index)
+        baselines = self._get_baselines(sorted_summary)
+        specs = {spec["spec_id"]: spec for spec in blizzcolors.Specs().specs}
+        for spec_id, baseline_y in zip(sorted_summary.iloc[:, 0], baselines):
+            spec_name = specs[spec_id]["spec_name"].upper()
             anno = self._make_spec_name_annotation(
                 position_x=0, position_y=baseline_y, text=spec_name
             )
@@ -212,13 +502,11 @@ class RidgePlot:
     def _make_spec_best_key_annos(self, sorted_summary):
         """Make best key annotations for each spec."""
         annotations = {}
-        vertical_offset = self._calculate_vertical_offset()
-        num_specs = len(sorted_summary)
-        for index, row in enumerate(list(sorted_summary.values)):
+        baselines = self._get_baselines(sorted_summary)
+        for row, baseline_y in zip(sorted_summary.itertuples(index=False), baselines):
             spec_id, _, best_key_level = row
-            baseline_y = vertical_offset * (num_specs - index)
             anno = self._make_spec_best_key_annotation(
-                position_x=best_key_level - 2,
+                position_x=self._key_level_x(best_key_level),
                 position_y=baseline_y,
                 text="+%d " % best_key_level,
             )
@@ -247,7 +535,7 @@ class RidgePlot:
     def _make_best_key_pointer_anno(self):
         """Makes BEST KEY label + arrow that points to the best key."""
         annotation = dict(
-            x=self.summary.best_key.max() - 2,
+            x=self._key_level_x(self.summary.best_key.max()),
             y=self._calculate_vertical_offset() * (36 + 1.5),
             align="center",
             showarrow=True,
@@ -390,8 +678,8 @@ class RidgePlot:
         """Extracts colors from traces."""
         default_colors = []
         for spec_traces in self.traces.values():
-            default_colors.append(spec_traces["ridge"].fillcolor)
-            default_colors.append(spec_traces["baseline"].line.color)
+            default_colors.append(spec_traces["ridge"]["fillcolor"])
+            default_colors.append(spec_traces["baseline"]["line"]["color"])
         return default_colors
 
     def _get_all_annotations(self):
@@ -400,7 +688,7 @@ class RidgePlot:
 
     def _assemble_components(self) -> Type[go.Figure]:
         """Assembles traces, annotations, and buttons into a plotly figure."""
-        fig = go.Figure(data=self._get_all_traces())
+        fig = make_figure(data=self._get_all_traces())
         fig.update_layout(height=1500, showlegend=False)
         fig.update_layout(updatemenus=self.buttons)
         fig.update_layout(annotations=self._keep_annotations("all"))
@@ -417,15 +705,15 @@ class RidgePlot:
         xaxis2 = dict(side="top", overlaying="x")
         xaxis2.update(xaxis_template)
 
-        bin_ymax = self.data.to_numpy().max()  # tallest spec/key bin
+        bin_ymax = self._get_ridge_heights().max()  # tallest spec/key bin
         ymax = 36 * self._calculate_vertical_offset() + bin_ymax + (bin_ymax * 0.1)
-        yaxis = go.layout.YAxis(range=[0, ymax], tickvals=[])
+        yaxis = dict(range=[0, ymax], tickvals=[])
         fig.update_layout(yaxis=yaxis)
         fig.update_layout(xaxis=xaxis, xaxis2=xaxis2)
         # this is a stupid hack... The upper x-axis won't show up unless
         # there is a trace associated with it. So associate this dummy trace
         # with the secondary axis. The trace is invisible.
-        fig.add_trace(go.Scatter(x=[1], y=[1], xaxis="x2", visible=False))
+        fig.add_trace(scatter(x=[1], y=[1], xaxis="x2", visible=False))
 
         title = dict(
             yref="container",
@@ -451,9 +739,9 @@ class BasicBarChart:
         """
         self.data = data
 
-        # adjust data to start with week 1
+        # adjust data to start with week 1 (on a copy, data may be shared)
         if self.data.period.min() != 1:
-            self.data.period = self.data.period - min(self.data.period) + 1
+            self.data = data.assign(period=data.period - data.period.min() + 1)
 
     def draw_figure(self) -> go.Figure:
         """Draws the bar histogram of period vs run count.
@@ -463,9 +751,9 @@ class BasicBarChart:
         fig : go.Figure
             the figure object run counts vs week
         """
-        fig = go.Figure(
+        fig = make_figure(
             data=[
-                go.Bar(
+                bar(
                     x=self.data.period,
                     y=self.data.run_count,
                     marker_color="lightgray",
@@ -473,7 +761,7 @@ class BasicBarChart:
                     hovertemplate="WEEK %{x}<br>%{y:,}<extra></extra>",
                     showlegend=False,
                 ),
-                go.Scatter(
+                scatter(
                     name="4 week moving average",
                     x=self.data.period,
                     y=self.data.run_count.rolling(4).mean(),
@@ -516,26 +804,23 @@ class BasicHistogram:
 
     def make_figure(self):
         """Draws plotly histogram."""
-        key_level = list(self.data.index)
-        runs = list(self.data.run_count.values)
-        total_runs = sum(runs)
-        percentile_rank = 100 * self.data.cumsum() / total_runs
-        custom_text = [
-            "KEY LEVEL: +{x}<br>RUNS: {y:,}".format(x=item[0], y=item[1])
-            for item in zip(key_level, runs)
-        ]
-        fig = go.Figure()
+        key_level = self.data.index.to_numpy()
+        runs = self.data.run_count.to_numpy()
+        percentile_rank = 100 * runs.cumsum() / runs.sum()
+        fig = make_figure()
         fig.add_trace(
-            go.Scatter(
+            scatter(
                 x=key_level,
                 y=runs,
                 mode="lines+markers",
                 line=dict(width=1, color="black", shape="spline"),
                 fillcolor="rgba(1,1,1,0.5)",
                 fill="tozeroy",
-                text=custom_text,
                 customdata=percentile_rank,
-                hovertemplate="%{text}" + "<extra>%{customdata:.2f} percentile</extra>",
+                hovertemplate=(
+                    "KEY LEVEL: +%{x}<br>RUNS: %{y:,}"
+                    "<extra>%{customdata:.2f} percentile</extra>"
+                ),
             )
         )
         fig.update_layout(
@@ -561,31 +846,43 @@ class BubblePlot:
         )
     )
 
-    def __init__(self, data, patch):
-        """Inits with spec run data."""
+    # bubble layouts by cache key (e.g. season and data version)
+    layouts = cache.LRUCache(maxsize=16)
+
+    def __init__(self, data, patch, cache_key=None):
+        """Inits with spec run data.
+
+        Parameters
+        ----------
+        data : DataFrame
+            spec should be the row, and level of key the columns
+        patch : str
+            patch name shown in the title
+        cache_key : Hashable, optional
+            identifies data (e.g. season and data version); bubble layouts
+            are reused for the same key
+        """
         self.data = data.sum(axis=1).sort_values(ascending=False)
         self.patch = patch
         self.specs = blizzcolors.Specs()
+        if cache_key is None:
+            self.layout = self._arrange_bubbles()
+        else:
+            self.layout = self.layouts.get_or_compute(cache_key, self._arrange_bubbles)
 
     def make_figure2(self):
-        (
-            marker_x,
-            marker_y,
-            marker_size,
-            marker_color,
-            marker_text,
-        ) = self._arrange_bubbles()
-        fig = go.Figure(
-            data=go.Scatter(
-                x=marker_x,
-                y=marker_y,
+        layout = self.layout
+        fig = make_figure(
+            data=scatter(
+                x=layout["x"],
+                y=layout["y"],
                 mode="markers",
                 marker_sizemode="area",
-                marker_size=marker_size,
-                marker_color=marker_color,
+                marker_size=layout["size"],
+                marker_color=layout["color"],
                 marker_opacity=0.9,
                 line_color="black",
-                text=marker_text,
+                text=layout["text"],
                 hovertemplate="%{text}<extra></extra>",
             ),
         )
@@ -605,64 +902,64 @@ class BubblePlot:
         return fig
 
     def _arrange_bubbles(self):
-        """Arranges bubble position on the canvas."""
-        spec_order = self.data.index
-        marker_size = []
-        marker_color = []
-        marker_y = []
-        marker_x = []
-        marker_text = []
+        """Arranges bubble position on the canvas.
+
+        Each role gets a row (tanks on top), specs in a row go from most to
+        least popular.
+
+        Returns
+        -------
+        layout : dict
+            marker 'x', 'y', 'size', 'color' and hover 'text' of each spec,
+            and the 'reference_sizes' (runs) of the legend bubbles
+        """
+        roles = ["tank", "healer", "mdps", "rdps"]
+        specs = {spec["spec_id"]: spec for spec in self.specs.specs}
+        known = self.data.index.isin(list(specs))
+        spec_ids = self.data.index.to_numpy()[known]
+        runs = self.data.to_numpy()[known]
+        role_rows = np.array(
+            [roles.index(specs[spec_id]["role"]) for spec_id in spec_ids]
+        )
+        # group specs by role, keeping the popularity order within the role
+        order = np.argsort(role_rows, kind="stable")
+        spec_ids, runs, role_rows = spec_ids[order], runs[order], role_rows[order]
+        # position of the first (most popular) spec of each spec's role
+        role_start = np.searchsorted(role_rows, role_rows)
+        runs_by_top_spec = runs[role_start]
         text_template = "%s<br>Number of runs: %s<br>Pct of top spec: %d%%<br>"
-        y = 4
-        for spec_role in ["tank", "healer", "mdps", "rdps"]:
-            spec_ids = self.specs.get_spec_ids_for_role(spec_role)
-            # sort spec from most to least popular
-            sorted_specs = []
-            for spec in spec_order:
-                if spec in spec_ids:
-                    sorted_specs.append(spec)
-
-            x = 1
-            runs_by_top_spec = self.data[sorted_specs[0]]
-            for spec_id in sorted_specs:
-                marker_y.append(y)
-                marker_x.append(x)
-                spec_color = "rgb(%d,%d,%d)" % self.specs.get_color(spec_id)
-                marker_color.append(spec_color)
-                marker_size.append(1500 * self.data[spec_id] / self.data.iloc[0])
-                marker_text.append(
-                    text_template
-                    % (
-                        self.specs.get_spec_name(spec_id).upper(),
-                        "{:,}".format(self.data[spec_id]),
-                        100 * (self.data[spec_id] / runs_by_top_spec),
-                    )
+        layout = dict(
+            x=np.arange(len(spec_ids)) - role_start + 1,
+            y=4 - role_rows,
+            size=1500 * runs / self.data.iloc[0],
+            color=["rgb(%d,%d,%d)" % specs[spec_id]["color"] for spec_id in spec_ids],
+            text=[
+                text_template
+                % (specs[spec_id]["spec_name"].upper(), "{:,}".format(run), pct)
+                for spec_id, run, pct in zip(
+                    spec_ids, runs, 100 * runs / runs_by_top_spec
                 )
-                x += 1
-            y -= 1
-        return marker_x, marker_y, marker_size, marker_color, marker_text
+            ],
+            reference_sizes=self.calibrate_reference_marker_size(),
+        )
+        return layout
 
     def calibrate_reference_marker_size(self):
         """Pick 3 reference bubbles most similar to the actual data."""
         largest_data_bubble = self.data.iloc[0]
         if largest_data_bubble < 100:
             return [1, 10, 100]
-        smallest_diff = 10e10
-        desired_ref = 0
-        for index, ref in enumerate(self.REFERENCE_SIZES):
-            diff = abs(largest_data_bubble - ref)
-            if smallest_diff > diff:
-                smallest_diff = diff
-                desired_ref = index
+        diffs = np.abs(np.array(self.REFERENCE_SIZES) - largest_data_bubble)
+        desired_ref = int(np.argmin(diffs))
         return self.REFERENCE_SIZES[desired_ref - 2 : desired_ref + 1]
 
     def _add_reference_bubbles(self):
         """Adds 1x, 10x, 100x reference legend."""
-        marker_size = self.calibrate_reference_marker_size()
+        marker_size = self.layout["reference_sizes"]
         # convert raw market size into relative size
         largest_data_bubble = self.data.iloc[0]
         marker_size = [1500 * ms / largest_data_bubble for ms in marker_size]
-        data = go.Scatter(
+        data = scatter(
             x=[9, 9, 9],
             y=[4, 3.6, 3],
             mode="markers",
@@ -681,7 +978,7 @@ class BubblePlot:
         """Adds label text next to reference bubbles."""
         x = [10] * 3
         y = [4, 3.6, 3]
-        ref_marker_size = self.calibrate_reference_marker_size()
+        ref_marker_size = self.layout["reference_sizes"]
         text = [self.REFERENCE_LABELS[ms] for ms in ref_marker_size]
         annotations = []
         for i in [0, 1, 2]:
@@ -717,28 +1014,32 @@ class BubblePlot:
             annotations.append(annotation)
         return annotations
 
-    def _get_marker_colors(self):
-        """Sets marker colors based on spec colors."""
-        marker_colors = []
-        for spec_id in self.data.index:
-            spec_color = "rgb(%d,%d,%d)" % self.specs.get_color(spec_id)
-            marker_colors.append(spec_color)
-        return marker_colors
-
 
 class StackedChart:
 
     hovertemplate = {
         "area+key": "KEY LEVEL: +%{x:d}<br> SHARE: %{y:.0f}%",
         "area+week": "WEEK: %{x}<br> SHARE: %{y:.0f}%",
-        "bar+key": "%{text}<br>KEY LEVEL: %{x}<br> SHARE: %{y:.0f}%<extra></extra>",
-        "bar+week": "%{text}<br>WEEK: %{x}<br> SHARE: %{y:.0f}%<extra></extra>",
+        "bar+key": "%{meta}<br>KEY LEVEL: %{x}<br> SHARE: %{y:.0f}%<extra></extra>",
+        "bar+week": "%{meta}<br>WEEK: %{x}<br> SHARE: %{y:.0f}%<extra></extra>",
+        # key level buckets, see bin_key_levels
+        "area+bucket": (
+            "KEY LEVEL: +%{customdata[0]} TO +%{customdata[1]}<br> SHARE: %{y:.0f}%"
+        ),
+        "bar+bucket": (
+            "%{meta}<br>KEY LEVEL: +%{customdata[0]} TO +%{customdata[1]}"
+            "<br> SHARE: %{y:.0f}%<extra></extra>"
+        ),
     }
 
     def __init__(self, data, xaxis_type, spec_role, patch):
         self.specs = blizzcolors.Specs()
         self.xaxis_type = xaxis_type
         self.spec_role = spec_role
+        self.bins = None  # (lower, upper) key levels of buckets, if binned
+        if xaxis_type == "key":
+            data, self.bins = bin_key_levels(data)
+        self.counts = data  # runs per spec (all roles) and x bin
         self.data = self.normalize_for_role(data, spec_role)
         self.patch = patch
         self.traces = None
@@ -753,12 +1054,55 @@ class StackedChart:
             data.columns = data.columns - min(data.columns) + 1
         return data
 
+    def _get_trace_styles(self):
+        """Looks up trace name and fill color of each spec in data once."""
+        specs = {spec["spec_id"]: spec for spec in self.specs.specs}
+        names = [specs[spec_id]["spec_name"].upper() for spec_id in self.data.index]
+        colors = [
+            "rgba(%d,%d,%d,0.7)" % specs[spec_id]["color"]
+            for spec_id in self.data.index
+        ]
+        return names, colors
+
+    def _make_traces(self):
+        """Creates a trace for each spec from rows of the normalized data."""
+        x = self.get_x()
+        spec_shares = self.data.to_numpy()
+        names, colors = self._get_trace_styles()
+        traces = [
+            self._make_trace(x, y, name, color)
+            for y, name, color in zip(spec_shares, names, colors)
+        ]
+        return traces
+
+    def get_x(self):
+        """Returns x of each bin, the middle key level of a bucket."""
+        if self.bins is None:
+            return self.data.columns.to_numpy()
+        lower, upper = self.bins
+        return (lower + upper) / 2
+
+    def get_bucket_properties(self, trace_type):
+        """Returns trace properties that show key level buckets, if binned."""
+        if self.bins is None:
+            return {}
+        lower, upper = self.bins
+        properties = dict(
+            customdata=np.column_stack([lower, upper]),
+            hovertemplate=self.hovertemplate[trace_type + "+bucket"],
+        )
+        if trace_type == "bar":
+            properties["width"] = upper - lower + 0.8  # 0.8 is plotly's default
+        return properties
+
     def get_xaxis(self) -> dict:
         """Creates plotly xaxis for the figure."""
         # add 0.5 padding to xrange for bar plots
         # otherwise, the bars are clipped by the axis box
-        min_x = min(list(self.data))
-        max_x = max(list(self.data))
+        min_x = int(min(list(self.data)))
+        max_x = int(max(list(self.data)))
+        if self.bins is not None:
+            max_x = int(self.bins[1][-1])
         padding = self.get_padding_for_bar()
         range_ = (min_x - padding, max_x + padding)
         if self.xaxis_type == "key":
@@ -802,7 +1146,7 @@ class StackedChart:
     def get_padding_for_bar(self):
         """Sets axis limit padding for bar plots."""
         padding = 0
-        if isinstance(self.traces[0], go.Bar):
+        if self.traces[0]["type"] == "bar":
             padding = 0.5
         return padding
 
@@ -820,7 +1164,7 @@ class StackedChart:
 
     def assemble_figure(self):
         """Assemble plotly figure from pre-made components."""
-        fig = go.Figure(
+        fig = make_figure(
             data=self.traces,
             layout=dict(
                 xaxis=self.get_xaxis(),
@@ -844,29 +1188,23 @@ class StackedAreaChart(StackedChart):
         super().__init__(data, xaxis_type, spec_role, patch)
         self.traces = self._make_traces()
 
-    def _make_traces(self):
-        """Crates traces for each spec in data set."""
-        spec_ids = self.specs.get_spec_ids_for_role(self.spec_role)
-        traces = []
-        for spec_id in spec_ids:
-            key_level = list(self.data)
-            spec_share = list(self.data.loc[self.data.index == spec_id, :].values[0])
-            spec_color = "rgba(%d,%d,%d,0.7)" % self.specs.get_color(spec_id)
-            trace = go.Scatter(
-                x=key_level,
-                y=spec_share,
-                mode="lines",
-                line=dict(width=1.5, color="black"),
-                hoveron="points",
-                hovertext="test",
-                hovertemplate=self.hovertemplate["area+" + self.xaxis_type],
-                fillcolor=spec_color,
-                stackgroup="one",
-                groupnorm="percent",
-                name=self.specs.get_spec_name(spec_id).upper(),
-            )
-            traces.append(trace)
-        return traces
+    def _make_trace(self, x, y, name, color):
+        """Creates stacked area trace of one spec."""
+        properties = dict(
+            x=x,
+            y=y,
+            mode="lines",
+            line=dict(width=1.5, color="black"),
+            hoveron="points",
+            hovertemplate=self.hovertemplate["area+" + self.xaxis_type],
+            fillcolor=color,
+            stackgroup="one",
+            groupnorm="percent",
+            name=name,
+        )
+        properties.update(self.get_bucket_properties("area"))
+        trace = scatter(**properties)
+        return trace
 
 
 class StackedBarChart(StackedChart):
@@ -874,27 +1212,74 @@ class StackedBarChart(StackedChart):
         super().__init__(data, xaxis_type, spec_role, patch)
         self.traces = self._make_traces()
 
-    def _make_traces(self):
-        """Crates traces for each spec in data set."""
-        spec_ids = self.specs.get_spec_ids_for_role(self.spec_role)
-        traces = []
-        for spec_id in spec_ids:
-            key_level = list(self.data)
-            spec_share = list(self.data.loc[self.data.index == spec_id, :].values[0])
-            spec_color = "rgba(%d,%d,%d,0.7)" % self.specs.get_color(spec_id)
-            traces.append(
-                go.Bar(
-                    name=self.specs.get_spec_name(spec_id).upper(),
-                    x=key_level,
-                    y=spec_share,
-                    marker=dict(color=spec_color, line=dict(color="black", width=1)),
-                    hoverlabel_align="right",
-                    text=[self.specs.get_spec_name(spec_id).upper()] * len(key_level),
-                    hoverlabel=dict(bgcolor="black"),
-                    hovertemplate=self.hovertemplate["bar+" + self.xaxis_type],
-                )
-            )
-        return traces
+    def _make_trace(self, x, y, name, color):
+        """Creates stacked bar trace of one spec."""
+        properties = dict(
+            name=name,
+            x=x,
+            y=y,
+            marker=dict(color=color, line=dict(color="black", width=1)),
+            hoverlabel_align="right",
+            meta=name,
+            hoverlabel=dict(bgcolor="black"),
+            hovertemplate=self.hovertemplate["bar+" + self.xaxis_type],
+        )
+        properties.update(self.get_bucket_properties("bar"))
+        trace = bar(**properties)
+        return trace
+
+
+def stacked_chart_store(data, xaxis_type, patch, decorate=None) -> dict:
+    """Packs a StackedBarChart so the browser can draw it for any role.
+
+    The browser (assets/clientside.js, metawatch.stackedChart) keeps the
+    rows of the selected role and renormalizes them to 100% in each x bin,
+    so switching roles needs no request to the server.
+
+    Parameters
+    ----------
+    data : DataFrame
+        runs per spec (rows) and key level or week (columns)
+    xaxis_type : str
+        'key' or 'week'
+    patch : str
+        patch name shown in the title
+    decorate : callable, optional
+        adds extras (e.g. annotations) to the figure layout
+
+    Returns
+    -------
+    store : dict
+        'x' values, run 'counts' and 'specs' (role, name, color) per spec,
+        'trace' template, figure 'layout' and per-role 'titles'; key level
+        buckets (see bin_key_levels) travel in the trace template
+    """
+    roles = ["tank", "healer", "mdps", "rdps"]
+    charts = {role: StackedBarChart(data, xaxis_type, role, patch) for role in roles}
+    fig = charts[roles[0]].assemble_figure()
+    if decorate is not None:
+        fig = decorate(fig)
+    fig = serialize(fig)
+    trace = fig["data"][0]
+    for name in ["x", "y", "name", "meta"]:
+        trace.pop(name, None)
+    trace["marker"].pop("color", None)
+    specs = []
+    spec_ids = []
+    for role, chart in charts.items():
+        names, colors = chart._get_trace_styles()
+        for spec_id, name, color in zip(chart.data.index, names, colors):
+            specs.append(dict(role=role, name=name, color=color))
+            spec_ids.append(spec_id)
+    store = dict(
+        x=_plain(charts[roles[0]].get_x()),
+        specs=specs,
+        counts=_plain(charts[roles[0]].counts.loc[spec_ids].to_numpy()),
+        trace=trace,
+        layout=fig["layout"],
+        titles={role: chart.get_fig_title() for role, chart in charts.items()},
+    )
+    return store
 
 
 class MetaIndexBarChart:
@@ -903,13 +1288,16 @@ class MetaIndexBarChart:
     Warning: Data must come from a single season.
     """
 
+    MUTED_COLOR = "rgba(1,1,1,0.4)"  # bars of specs outside the selected role
+
     def __init__(self, data: pd.DataFrame, spec_role: str) -> None:
-        """Inits with key runs numbers and target spec role.
+        """Inits with cumulative key runs numbers and target spec role.
 
         Parameters
         ----------
         data : pd.DataFrame
-            dataframe where data[spec, key level] = number of keys
+            dataframe where data[spec, key level] = number of keys at or below
+            that key level; columns must be consecutive key levels
         spec_role : str
             specs to include in the figure one of {melee, range, tank, healer, all}
         """
@@ -930,19 +1318,20 @@ class MetaIndexBarChart:
             The bar chart of spec meta indices
         """
         spec_meta = self._calculate_index(bounds)
-        spec_meta.sort_values(by="spec_meta_index", inplace=True)
+        # stable sort, so tied specs keep the same order as in the browser
+        spec_meta.sort_values(by="spec_meta_index", inplace=True, kind="mergesort")
         spec_utils = blizzcolors.Specs()
 
-        fig = go.Figure()
+        fig = make_figure()
         fig = self._add_tier_annotations(fig)
-        trace = go.Bar(
+        trace = bar(
             x=list(spec_meta.spec_meta_index),
             y=list(range(len(spec_meta))),
             marker_color=[
                 "rgba(%d,%d,%d,0.9)" % spec_utils.get_color(spec_id)
                 if spec_utils.get_role(spec_id) == self.spec_role
                 or self.spec_role == "all"
-                else "rgba(1,1,1,0.4)"
+                else self.MUTED_COLOR
                 for spec_id in spec_meta.index
             ],
             text=[
@@ -968,24 +1357,73 @@ class MetaIndexBarChart:
             yaxis_range=[-1, len(spec_meta.index)],
         )
         # This is annoying... I have to update bar labels separetly.
-        # I can't do it as part of go.Bar() definition, because some of the labels
+        # I can't do it as part of bar() definition, because some of the labels
         # are identical and plotly merges them into a single bar
         # (eg Frost mage and Frost DK are shown as a single bar)
-        fig.update_yaxes(
-            tickmode="array",
-            tickvals=trace.y,
-            ticktext=[
-                spec_utils.get_spec_name(spec_id).upper() for spec_id in spec_meta.index
-            ],
+        fig.update_layout(
+            yaxis=dict(
+                tickmode="array",
+                tickvals=trace["y"],
+                ticktext=[
+                    spec_utils.get_spec_name(spec_id).upper()
+                    for spec_id in spec_meta.index
+                ],
+            )
         )
         return fig
 
+    def to_store(self, title: str) -> dict:
+        """Packs the chart so the browser can draw it for any bounds and role.
+
+        The browser (assets/clientside.js, metawatch.tierList) computes the
+        meta index from the cumulative counts, so slider and role changes
+        need no request to the server.
+
+        Parameters
+        ----------
+        title : str
+            figure title
+
+        Returns
+        -------
+        store : dict
+            'first_level' of the 'cumulative' counts (rows are specs),
+            'specs' (role, name, color) per row, color of specs outside
+            the selected role, and the figure without bar data
+        """
+        first_level = int(self.data.columns[0])
+        fig = self.create_figure([first_level] * 4)
+        fig.update_layout(title_text=title)
+        fig = serialize(fig)
+        bar = fig["data"][-1]
+        for name in ["x", "y", "text"]:
+            bar.pop(name, None)
+        bar["marker"].pop("color", None)
+        for name in ["tickvals", "ticktext", "range"]:
+            fig["layout"]["yaxis"].pop(name, None)
+        specs = {spec["spec_id"]: spec for spec in blizzcolors.Specs().specs}
+        store = dict(
+            first_level=first_level,
+            cumulative=_plain(self.data),
+            specs=[
+                dict(
+                    role=specs[spec_id]["role"],
+                    name=specs[spec_id]["spec_name"].upper(),
+                    color="rgba(%d,%d,%d,0.9)" % specs[spec_id]["color"],
+                )
+                for spec_id in self.data.index
+            ],
+            muted_color=self.MUTED_COLOR,
+            figure=fig,
+        )
+        return store
+
     @staticmethod
     def _add_tier_annotations(fig: go.Figure) -> go.Figure:
         """Adds tier annotations to the figure."""
         fig.add_traces(
             [
-                go.Scatter(x=[x_, x_], y=[-2, 40], line_color="gray", line_dash="dash")
+                scatter(x=[x_, x_], y=[-2, 40], line_color="gray", line_dash="dash")
                 for x_ in [1.5, 1, 0.5]
             ]
         )
@@ -1023,7 +1461,8 @@ class MetaIndexBarChart:
         Returns
         -------
         spec_meta_index : pd.DataFrame
-            ratio of specs' representation between the two cohorts
+            ratio of specs' representation between the two cohorts; 0 for
+            specs without runs in the population cohort
         """
         pop_low = bounds[0]
         pop_high = bounds[1]
@@ -1033,13 +1472,23 @@ class MetaIndexBarChart:
         # at population level and at meta level
         population_spec_pct = self._calc_spec_pct_in_bin(pop_low, pop_high)
         meta_spec_pct = self._calc_spec_pct_in_bin(meta_low, meta_high)
-        # meta strength index is the ratio between the two
-        spec_meta_index = meta_spec_pct / population_spec_pct
-        spec_meta_index.columns = ["spec_meta_index"]
-        spec_meta_index.fillna(0, inplace=True)
+        # meta strength index is the ratio between the two; specs without
+        # population-level runs get 0, the value a spec without rows in the
+        # population cohort always got (NaN filled). Explicit zero-count rows
+        # used to give inf instead; the summary tables have none, and inf
+        # cannot be sent to the client-side tier list as JSON
+        spec_meta_index = np.divide(
+            meta_spec_pct,
+            population_spec_pct,
+            out=np.zeros_like(meta_spec_pct),
+            where=population_spec_pct > 0,
+        )
+        spec_meta_index = pd.DataFrame(
+            {"spec_meta_index": spec_meta_index}, index=self.data.index
+        )
         return spec_meta_index
 
-    def _calc_spec_pct_in_bin(self, lower_bound: int, upper_bound: int) -> pd.DataFrame:
+    def _calc_spec_pct_in_bin(self, lower_bound: int, upper_bound: int) -> np.ndarray:
         """Calculates representation of each spec as pct within key level bounds.
 
         Parameters
@@ -1051,16 +1500,19 @@ class MetaIndexBarChart:
 
         Returns
         -------
-        cohort_spec_pct : pd.DataFrame
+        cohort_spec_pct : np.ndarray
             counts by each spec within the cohort, converted to percent
         """
-        cohort_spec_counts = (
-            self.data.loc[
-                (self.data.level >= lower_bound) & (self.data.level <= upper_bound),
-                ["spec", "run_count"],
-            ]
-            .groupby("spec")
-            .sum()
-        )
-        cohort_spec_pct = cohort_spec_counts / cohort_spec_counts.sum()
+        # runs in [lower, upper] = cumulative[upper] - cumulative[lower - 1]
+        first_level = self.data.columns[0]
+        last_pos = len(self.data.columns) - 1
+        lower_pos = min(max(lower_bound - 1 - first_level, 0), last_pos)
+        upper_pos = min(max(upper_bound - first_level, 0), last_pos)
+        cumulative = self.data.to_numpy()
+        cohort_spec_counts = cumulative[:, upper_pos] - cumulative[:, lower_pos]
+        cohort_spec_counts = cohort_spec_counts.clip(min=0)
+        total = cohort_spec_counts.sum()
+        if total == 0:
+            return np.zeros(len(cohort_spec_counts))
+        cohort_spec_pct = cohort_spec_counts / total
         return cohort_spec_pct